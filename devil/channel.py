@@ -1,8 +1,10 @@
 import msgpack
 import numpy as np
 import qtzmq
+import time
 import zmq
 
+from devil.channelstats import ChannelStats, STATS_INTERVAL_MSECS
 from enum import Enum, unique
 from PyQt4 import QtCore as QtC
 
@@ -12,9 +14,40 @@ MSGPACKRPC_NOTIFICATION = 2
 
 MSGPACK_EXT_INT8ARRAY = 1
 
+# Topic prefix of the packets for a given stream index on the multiplexed
+# stream port. The trailing separator keeps e.g. stream 1 from also matching
+# stream 10 with zmq's prefix-based subscriptions.
+STREAM_TOPIC_FORMAT = 'stream/{}/'
+
+# To match true 10 bit range of hardware resolution; mainly to account for an
+# eventual upgrade and to not break user expectations from the old client.
+INT8ARRAY_SAMPLE_SCALE = 4
+
 HEARTBEAT_INTERVAL_MSECS = 5000
 HEARTBEAT_TIMEOUT_MSECS = 2000
 
+# Interval at which the newest packets are delivered to coalescing stream
+# subscribers; roughly one display refresh.
+STREAM_COALESCING_INTERVAL_MSECS = 16
+
+# Maximum number of RPC requests in flight at the same time. Any further
+# requests are queued until a response arrives.
+DEFAULT_RPC_WINDOW_SIZE = 8
+
+# msgpack-rpc sequence ids are 32 bit unsigned integers.
+MSGPACKRPC_MAX_SEQ_ID = 2 ** 32 - 1
+
+# msgpack-rpc does not standardize error objects; an error response is taken
+# to mean that the remote end does not implement the method if its text
+# contains any of these (compared case-insensitively).
+METHOD_NOT_FOUND_ERROR_MARKERS = ['nomethoderror', 'method not found',
+                                  'unknown method', 'no such method']
+
+
+def is_method_not_found_error(err):
+    text = str(err).lower()
+    return any(m in text for m in METHOD_NOT_FOUND_ERROR_MARKERS)
+
 
 class Register(QtC.QObject):
     changed_locally = QtC.pyqtSignal(int, int)
@@ -92,25 +125,140 @@ class ErrorCondition:
 
 
 class StreamPacket:
+    """
+    A block of samples received from a stream.
+
+    The received buffer is wrapped without copying (see raw_samples); it is
+    only widened and scaled to the hardware range when a consumer actually
+    asks for the samples.
+    """
+
     def __init__(self, stream_idx, sample_interval_seconds, trigger_offset,
-                 data_type, data_buffer):
+                 data_type, data_buffer, timestamp=None):
         self.stream_idx = stream_idx
         self.sample_interval_seconds = sample_interval_seconds
         self.trigger_offset = trigger_offset
 
-        if data_type == MSGPACK_EXT_INT8ARRAY:
-            self.samples = np.fromstring(data_buffer, np.int8).astype(np.int16)
+        # The device does not timestamp the packets, so default to the time of
+        # reception (seconds since the epoch).
+        self.timestamp = time.time() if timestamp is None else timestamp
 
-            # To match true 10 bit range of hardware resolution; mainly to
-            # account for an eventual upgrade and to not break user expectations
-            # from the old client.
-            self.samples *= 4
+        if data_type == MSGPACK_EXT_INT8ARRAY:
+            self.raw_samples = np.frombuffer(data_buffer, np.int8)
         else:
             raise Exception(
                 'Unknown stream sample data type: {}'.format(data_type))
 
+        # Time spent decoding the packet (and converting the samples, if done
+        # ahead of time on an I/O thread); see ChannelStats.
+        self.decode_secs = 0.0
+
+        self._samples = None
+
+    def __len__(self):
+        return len(self.raw_samples)
+
+    @property
+    def samples(self):
+        """The samples as int16 array, scaled to the 10 bit hardware range.
+
+        The array is computed on first access and shared between all consumers
+        of this packet, so it must not be modified in place.
+        """
+        if self._samples is None:
+            self._samples = self.samples_into(
+                np.empty(len(self.raw_samples), np.int16))
+        return self._samples
+
+    def samples_into(self, out):
+        """
+        Writes the scaled samples into the beginning of the given int16 array,
+        e.g. a buffer preallocated by the caller that is reused across packets.
+
+        Returns the view of out that has been written to.
+        """
+        n = len(self.raw_samples)
+        dest = out[:n]
+        np.multiply(self.raw_samples, INT8ARRAY_SAMPLE_SCALE, out=dest,
+                    dtype=np.int16)
+        return dest
+
+
+def decode_stream_packet(stream_idx, msg):
+    """
+    Decodes a streamPacket notification into a StreamPacket.
+
+    Does not touch any Qt objects, so it is safe to call from an I/O thread.
+    """
+    msg_type, method, params = msgpack.unpackb(msg, encoding='utf-8')
+    if msg_type != MSGPACKRPC_NOTIFICATION:
+        raise Exception('Expected msgpack-rpc notification for streaming '
+                        'packet, but got: {}'.format(msg_type))
+
+    if method != 'streamPacket':
+        raise Exception('Invalid method on streaming socket: {}'.format(method))
+
+    p = params[0]
+    interval = p['sampleIntervalSeconds']
+    trigger = p['triggerOffset']
+    sample_type = p['samples'].code
+    sample_buffer = p['samples'].data
+    return StreamPacket(stream_idx, interval, trigger, sample_type,
+                        sample_buffer)
+
+
+def stream_topic(stream_idx):
+    return STREAM_TOPIC_FORMAT.format(stream_idx).encode()
+
+
+class MalformedStreamMessage(Exception):
+    """
+    A message on a stream socket that does not have the expected structure and
+    is dropped rather than treated as a fatal protocol error.
+    """
+    pass
+
+
+def decode_multiplexed_stream_packet(frames):
+    """
+    Decodes a (topic, streamPacket notification) message as received from the
+    multiplexed stream port.
+    """
+    if len(frames) != 2:
+        raise MalformedStreamMessage(
+            'Expected topic and packet frames, got {} frame(s)'.format(
+                len(frames)))
+    topic, msg = frames
+    try:
+        stream_idx = int(topic.split(b'/')[1])
+    except (IndexError, ValueError):
+        stream_idx = None
+    if stream_idx is None or topic != stream_topic(stream_idx):
+        raise Exception('Invalid stream topic: {}'.format(topic))
+    return decode_stream_packet(stream_idx, msg)
+
+
+def _decode_timed(decode_fn, msg, convert_samples=False):
+    start = time.perf_counter()
+    packet = decode_fn(msg)
+    if convert_samples:
+        # Used on the I/O thread, so the GUI thread is handed a packet that is
+        # ready to be displayed.
+        packet.samples
+    packet.decode_secs = time.perf_counter() - start
+    return packet
+
+
+class ChannelBase(QtC.QObject):
+    """
+    Interface of a channel as seen by the GUI, independent of where the data
+    comes from.
+
+    Takes care of the stream subscriber reference counting and coalescing;
+    subclasses implement _start_stream()/_stop_stream() and pass received
+    packets to _dispatch_stream_packet().
+    """
 
-class Channel(QtC.QObject):
     @unique
     class Status(Enum):
         idle = 0
@@ -123,39 +271,36 @@ class Channel(QtC.QObject):
     error_conditions_changed = QtC.pyqtSignal(list)
     status_changed = QtC.pyqtSignal(Status)
     stream_packet_received = QtC.pyqtSignal(StreamPacket)
+
+    # Only carries the newest packet per stream received since the last
+    # coalescing interval, for streams with coalescing subscribers.
+    latest_stream_packet_received = QtC.pyqtSignal(StreamPacket)
     stream_acquisition_config_changed = QtC.pyqtSignal(float, int)
 
-    def __init__(self, zmq_ctx, host_addr, resource):
+    # Emitted every STATS_INTERVAL_MSECS after the values in stats have been
+    # updated.
+    stats_updated = QtC.pyqtSignal()
+
+    def __init__(self, resource):
         QtC.QObject.__init__(self)
 
         self.resource = resource
 
-        self._zmq_ctx = zmq_ctx
-        self._host_addr = host_addr
-        self._pending_rpc_request = None
-        self._rpc_request_queue = []
-        self._active_stream_sockets = {}
-
-        self._reg_idx_to_object = {}
-
-        self._rpc_socket = qtzmq.Socket(zmq_ctx, zmq.REQ)
-        self._rpc_socket.received_msg.connect(
-            lambda m: QtC.qCritical(
-                'Unhandled message on RPC socket: {}'.format(m)))
-        self._rpc_socket.error.connect(self._socket_error)
-        self._rpc_socket.connect(self._remote_endpoint(resource.port))
-
-        self._heartbeat_send_timer = QtC.QTimer()
-        self._heartbeat_send_timer.timeout.connect(self._send_heartbeat)
+        self._stream_subscriber_count = {}
+        self._coalescing_subscriber_count = {}
+        self._latest_stream_packets = {}
 
-        self._heartbeat_timeout_timer = QtC.QTimer()
-        self._heartbeat_timeout_timer.timeout.connect(self._heartbeat_timed_out)
+        self._coalescing_timer = QtC.QTimer()
+        self._coalescing_timer.setSingleShot(True)
+        self._coalescing_timer.timeout.connect(
+            self._emit_latest_stream_packets)
 
-        self._stream_ports = []
-        self._stream_subscriber_count = {}
         self._stream_acquisition_config = None
 
-        self._invoke_rpc('notificationPort', [], self._got_notification_port)
+        self.stats = ChannelStats()
+        self._stats_timer = QtC.QTimer()
+        self._stats_timer.timeout.connect(self._update_stats)
+        self._stats_timer.start(STATS_INTERVAL_MSECS)
 
     def unlock(self):
         raise NotImplementedError('Need to implement function that unlocks '
@@ -170,43 +315,189 @@ class Channel(QtC.QObject):
         raise NotImplementedError('Need to implement status reading for this '
                                   'specific channel type.')
 
-    def add_stream_subscription(self, stream_idx):
+    def add_stream_subscription(self, stream_idx, coalesce=False):
+        """
+        Starts receiving packets for the given stream.
+
+        Coalescing subscribers are interested only in the most recent data
+        (e.g. for display) and should connect to latest_stream_packet_received,
+        which is emitted at most once per STREAM_COALESCING_INTERVAL_MSECS for
+        each stream, skipping any packets that arrived in between.
+        """
+        if coalesce:
+            self._coalescing_subscriber_count[stream_idx] = \
+                self._coalescing_subscriber_count.get(stream_idx, 0) + 1
+
         old_count = self._stream_subscriber_count.get(stream_idx, 0)
         self._stream_subscriber_count[stream_idx] = old_count + 1
 
         if old_count == 0:
-            s = qtzmq.Socket(self._zmq_ctx, zmq.SUB)
-            s.received_msg.connect(
-                lambda msg: self._got_stream_packet(stream_idx, msg))
-            s.connect(self._remote_endpoint(self._stream_ports[stream_idx]))
-            self._active_stream_sockets[stream_idx] = s
+            self._start_stream(stream_idx)
+
+    def remove_stream_subscription(self, stream_idx, coalesce=False):
+        if coalesce:
+            self._coalescing_subscriber_count[stream_idx] -= 1
+            if self._coalescing_subscriber_count[stream_idx] == 0:
+                self._latest_stream_packets.pop(stream_idx, None)
 
-    def remove_stream_subscription(self, stream_idx):
         self._stream_subscriber_count[stream_idx] -= 1
 
         if self._stream_subscriber_count[stream_idx] == 0:
-            # Check whether we are still connected to make channel shutdown code
-            # less order-sensitive.
-            if stream_idx in self._active_stream_sockets:
-                self._active_stream_sockets[stream_idx].close()
-                del self._active_stream_sockets[stream_idx]
+            self._stop_stream(stream_idx)
 
     def stream_acquisition_config(self):
         return self._stream_acquisition_config
 
+    def set_stream_acquisition_config(self, time_span_seconds, points):
+        raise NotImplementedError('Need to implement stream acquisition '
+                                  'configuration for this specific channel '
+                                  'type.')
+
+    def registers(self):
+        return []
+
+    def _start_stream(self, stream_idx):
+        raise NotImplementedError()
+
+    def _stop_stream(self, stream_idx):
+        raise NotImplementedError()
+
+    def _stop_timers(self):
+        """
+        Stops all timers of the base class; to be called by subclasses when
+        the channel shuts down.
+        """
+        self._stats_timer.stop()
+        self._coalescing_timer.stop()
+        self._latest_stream_packets.clear()
+
+    def _collect_stats(self):
+        """
+        Called before the stats are updated, for subclasses to fill in the
+        values that are sampled rather than counted.
+        """
+        pass
+
+    def _update_stats(self):
+        self._collect_stats()
+        self.stats.roll()
+        self.stats_updated.emit()
+
+    def _dispatch_stream_packet(self, packet):
+        self.stats.record_packet(packet)
+        self.stream_packet_received.emit(packet)
+
+        if self._coalescing_subscriber_count.get(packet.stream_idx):
+            if packet.stream_idx in self._latest_stream_packets:
+                self.stats.record_coalesced_packet()
+            self._latest_stream_packets[packet.stream_idx] = packet
+            if not self._coalescing_timer.isActive():
+                self._coalescing_timer.start(STREAM_COALESCING_INTERVAL_MSECS)
+
+    def _emit_latest_stream_packets(self):
+        packets = list(self._latest_stream_packets.values())
+        self._latest_stream_packets.clear()
+        for p in packets:
+            self.latest_stream_packet_received.emit(p)
+
+
+class Channel(ChannelBase):
+    def __init__(self, zmq_ctx, host_addr, resource,
+                 rpc_window_size=DEFAULT_RPC_WINDOW_SIZE,
+                 stream_receiver=None, multiplex_streams=False):
+        """
+        If a qtzmq.ReceiverThread is passed as stream_receiver, stream packets
+        are received and decoded on its worker thread instead of the GUI
+        thread.
+
+        If multiplex_streams is set and the device supports it, all streams
+        are received through a single socket using topic subscriptions instead
+        of one socket per stream. This costs an extra round trip while
+        connecting, so it is off by default.
+        """
+        ChannelBase.__init__(self, resource)
+
+        self._zmq_ctx = zmq_ctx
+        self._stream_receiver = stream_receiver
+        self._host_addr = host_addr
+        self._rpc_window_size = rpc_window_size
+        self._next_rpc_seq_id = 0
+        self._pending_rpc_requests = {}
+        self._rpc_request_queue = []
+        self._active_stream_sockets = {}
+        self._dropped_msgs_on_closed_sockets = 0
+        self._malformed_stream_msgs = 0
+        self._heartbeat_sent_time = None
+
+        self._reg_idx_to_object = {}
+
+        # We use a DEALER socket instead of REQ so that multiple requests can
+        # be in flight at once; responses are matched up using the msgpack-rpc
+        # sequence ids and may arrive in any order.
+        self._rpc_socket = qtzmq.Socket(zmq_ctx, zmq.DEALER)
+        self._rpc_socket.received_msg.connect(self._got_rpc_response)
+        self._rpc_socket.error.connect(self._socket_error)
+        self._rpc_socket.connect(self._remote_endpoint(resource.port))
+
+        self._heartbeat_send_timer = QtC.QTimer()
+        self._heartbeat_send_timer.timeout.connect(self._send_heartbeat)
+
+        self._heartbeat_timeout_timer = QtC.QTimer()
+        self._heartbeat_timeout_timer.timeout.connect(self._heartbeat_timed_out)
+
+        # Whether the remote end implements the readRegisters batch call. We
+        # optimistically assume it does until we learn otherwise; older
+        # firmware only supports reading registers one by one.
+        self._supports_bulk_register_read = True
+
+        self._multiplex_streams = multiplex_streams
+        self._multiplexed_stream_port = None
+        self._multiplexed_stream_socket = None
+        self._multiplexed_streams = set()
+
+        self._stream_ports = []
+
+        self._invoke_rpc('notificationPort', [], self._got_notification_port)
+
     def set_stream_acquisition_config(self, time_span_seconds, points):
         config = time_span_seconds, points
         if config != self._stream_acquisition_config:
             self._invoke_rpc('setStreamAcquisitionConfig', config)
 
+    def _start_stream(self, stream_idx):
+        if self._multiplexed_stream_port is not None:
+            if not self._multiplexed_stream_socket:
+                self._multiplexed_stream_socket = self._open_stream_socket(
+                    self._multiplexed_stream_port,
+                    decode_multiplexed_stream_packet, topics=(), multipart=True)
+            self._multiplexed_stream_socket.subscribe_topic(
+                stream_topic(stream_idx))
+            self._multiplexed_streams.add(stream_idx)
+        else:
+            self._active_stream_sockets[stream_idx] = self._open_stream_socket(
+                self._stream_ports[stream_idx],
+                lambda msg: decode_stream_packet(stream_idx, msg))
+
+    def _stop_stream(self, stream_idx):
+        # Check whether we are still connected to make channel shutdown code
+        # less order-sensitive.
+        if stream_idx in self._active_stream_sockets:
+            self._close_stream_socket(
+                self._active_stream_sockets.pop(stream_idx))
+        elif stream_idx in self._multiplexed_streams:
+            self._multiplexed_streams.remove(stream_idx)
+            if self._multiplexed_streams:
+                self._multiplexed_stream_socket.unsubscribe_topic(
+                    stream_topic(stream_idx))
+            else:
+                self._close_stream_socket(self._multiplexed_stream_socket)
+                self._multiplexed_stream_socket = None
+
     def _modify_register(self, reg_idx, old_val, new_val):
         self._invoke_rpc('modifyRegister', [reg_idx, old_val, new_val],
                          lambda succeeded: succeeded or self._register_conflict(
                              reg_idx))
 
-    def registers(self):
-        return []
-
     def _register_conflict(self, reg_idx):
         self._reg_idx_to_object[reg_idx].mark_as_desynchronized()
         self._read_registers([reg_idx])
@@ -222,7 +513,27 @@ class Channel(QtC.QObject):
     def _got_stream_ports(self, ports):
         self._stream_ports = ports
 
-        # Initialize registers.
+        if not self._multiplex_streams:
+            self._init_registers()
+            return
+
+        def handle(port):
+            self._multiplexed_stream_port = port
+            self._init_registers()
+
+        def handle_error(err):
+            if not is_method_not_found_error(err):
+                self._rpc_error(err)
+                return
+
+            QtC.qDebug('[{}] multiplexedStreamPort not supported ({}), using '
+                       'one socket per stream'.format(
+                           self.resource.display_name, err))
+            self._init_registers()
+
+        self._invoke_rpc('multiplexedStreamPort', [], handle, handle_error)
+
+    def _init_registers(self):
         regs = self.registers()
         for r in regs:
             self._reg_idx_to_object[r.idx] = r
@@ -239,13 +550,48 @@ class Channel(QtC.QObject):
                 completion_handler()
             return
 
-        idx = registers.pop(0)
+        if not self._supports_bulk_register_read:
+            self._read_registers_individually(registers, completion_handler)
+            return
+
+        def handle(vals):
+            if len(vals) != len(registers):
+                self._rpc_error('Expected {} register values, but got {}'.format(
+                    len(registers), len(vals)))
+                return
 
-        def handle(val):
+            for idx, val in zip(registers, vals):
+                self._reg_idx_to_object[idx].set_from_remote_query(val)
+            if completion_handler:
+                completion_handler()
+
+        def handle_error(err):
+            if not is_method_not_found_error(err):
+                self._rpc_error(err)
+                return
+
+            QtC.qDebug('[{}] readRegisters not supported ({}), falling back '
+                       'to individual reads'.format(self.resource.display_name,
+                                                    err))
+            self._supports_bulk_register_read = False
+            self._read_registers_individually(registers, completion_handler)
+
+        self._invoke_rpc('readRegisters', [registers], handle, handle_error)
+
+    def _read_registers_individually(self, registers, completion_handler):
+        # All requests are issued at once and pipelined by the RPC layer; the
+        # completion handler runs once the last response has come in.
+        outstanding = set(registers)
+
+        def handle(idx, val):
             self._reg_idx_to_object[idx].set_from_remote_query(val)
-            self._read_registers(registers, completion_handler)
+            outstanding.discard(idx)
+            if not outstanding and completion_handler:
+                completion_handler()
 
-        self._invoke_rpc('readRegister', [idx], handle)
+        for idx in registers:
+            self._invoke_rpc('readRegister', [idx],
+                             lambda val, idx=idx: handle(idx, val))
 
     def _read_stream_acquisition_config(self):
         self._invoke_rpc('streamAcquisitionConfig', [],
@@ -260,12 +606,19 @@ class Channel(QtC.QObject):
 
     def _shutdown(self):
         self._rpc_socket.close()
+        self._rpc_request_queue.clear()
+        self._pending_rpc_requests.clear()
         self._heartbeat_send_timer.stop()
         self._heartbeat_timeout_timer.stop()
+        self._stop_timers()
         self._notification_socket.close()
         for s in self._active_stream_sockets.values():
-            s.close()
+            self._close_stream_socket(s)
         self._active_stream_sockets.clear()
+        if self._multiplexed_stream_socket:
+            self._close_stream_socket(self._multiplexed_stream_socket)
+            self._multiplexed_stream_socket = None
+        self._multiplexed_streams.clear()
 
         self.shutting_down.emit()
 
@@ -300,38 +653,79 @@ class Channel(QtC.QObject):
         except Exception as e:
             self._rpc_error('Error while handling notification: {} ({})'.format(e, type(e)))
 
-    def _got_stream_packet(self, stream_idx, msg):
+    def _open_stream_socket(self, port, decode_fn, topics=(b'',),
+                            multipart=False):
+        endpoint = self._remote_endpoint(port)
+        if self._stream_receiver:
+            return self._stream_receiver.subscribe(
+                endpoint, lambda msg: _decode_timed(decode_fn, msg, True),
+                self._dispatch_stream_packet, self._stream_packet_error,
+                topics, multipart)
+
+        s = qtzmq.Socket(self._zmq_ctx, zmq.SUB, topics)
+        received = s.received_multipart_msg if multipart else s.received_msg
+        received.connect(lambda msg: self._got_stream_packet(decode_fn, msg))
+        if multipart:
+            # qtzmq.Socket delivers messages that consist of a single frame
+            # separately; pass them on as such so they are rejected by the
+            # decode function just like on the ReceiverThread path.
+            s.received_msg.connect(
+                lambda msg: self._got_stream_packet(decode_fn, [msg]))
+        s.connect(endpoint)
+        return s
+
+    def _close_stream_socket(self, s):
+        self._dropped_msgs_on_closed_sockets += s.dropped_msgs
+        s.close()
+
+    def _collect_stats(self):
+        stats = self.stats
+        stats.rpc_queue_depth = len(self._rpc_request_queue)
+        stats.rpc_in_flight = len(self._pending_rpc_requests)
+
+        sockets = list(self._active_stream_sockets.values())
+        if self._multiplexed_stream_socket:
+            sockets.append(self._multiplexed_stream_socket)
+        stats.total_dropped_packets = self._dropped_msgs_on_closed_sockets + \
+            self._malformed_stream_msgs + sum(s.dropped_msgs for s in sockets)
+
+    def _got_stream_packet(self, decode_fn, msg):
         try:
-            msg_type, method, params = msgpack.unpackb(msg, encoding='utf-8')
-            if msg_type != MSGPACKRPC_NOTIFICATION:
-                self._rpc_error('Expected msgpack-rpc notification for '
-                                'streaming packet, but got: {}'.format(msg_type))
-                return
+            packet = _decode_timed(decode_fn, msg)
+        except Exception as e:
+            self._stream_packet_error(e)
+            return
 
-            if method != 'streamPacket':
-                self._rpc_error(
-                    'Invalid method on streaming socket: {}'.format(method))
-                return
+        self._dispatch_stream_packet(packet)
 
-            p = params[0]
-            interval = p['sampleIntervalSeconds']
-            trigger = p['triggerOffset']
-            sample_type = p['samples'].code
-            sample_buffer = p['samples'].data
-            packet = StreamPacket(stream_idx, interval, trigger, sample_type,
-                                  sample_buffer)
+    def _stream_packet_error(self, err):
+        if isinstance(err, MalformedStreamMessage):
+            self._malformed_stream_msgs += 1
+            if self._malformed_stream_msgs == 1:
+                QtC.qWarning('[{}] Dropping malformed stream message: {} '
+                             '(further ones are only counted in the '
+                             'statistics)'.format(self.resource.display_name,
+                                                  err))
+            return
 
-            self.stream_packet_received.emit(packet)
-        except Exception as e:
-            self._rpc_error('Error while handling stream packet: {}'.format(e))
+        self._rpc_error('Error while handling stream packet: {}'.format(err))
+
+    def _invoke_rpc(self, method, args, response_handler=None,
+                    error_handler=None):
+        """
+        Queues a msgpack-rpc request for sending.
 
-    def _invoke_rpc(self, method, args, response_handler=None):
-        # We do not use the sequence id, just pass zero.
-        request = msgpack.packb((MSGPACKRPC_REQUEST, 0, method, args))
+        If no error_handler is given, an error response is treated as fatal and
+        causes the connection to be shut down.
+        """
+        seq_id = self._next_rpc_seq_id
+        self._next_rpc_seq_id = (seq_id + 1) % (MSGPACKRPC_MAX_SEQ_ID + 1)
 
-        self._rpc_request_queue.append((request, response_handler))
-        if not self._pending_rpc_request:
-            self._send_next_rpc_request()
+        request = msgpack.packb((MSGPACKRPC_REQUEST, seq_id, method, args))
+
+        self._rpc_request_queue.append(
+            (seq_id, request, (response_handler, error_handler)))
+        self._send_queued_rpc_requests()
 
     def _got_rpc_response(self, response):
         try:
@@ -340,34 +734,49 @@ class Channel(QtC.QObject):
             if msg_type != MSGPACKRPC_RESPONSE:
                 self._rpc_error(
                     'Unexpected msgpack-rpc message type: {}'.format(msg_type))
-            elif err:
-                self._rpc_error(err)
-            else:
-                _, response_handler = self._pending_rpc_request
-                if response_handler:
-                    response_handler(ret_val)
+                return
+
+            if seq_id not in self._pending_rpc_requests:
+                self._rpc_error(
+                    'Response for unknown sequence id: {}'.format(seq_id))
+                return
 
-            self._pending_rpc_request = None
-            if self._rpc_request_queue:
-                self._send_next_rpc_request()
+            response_handler, error_handler, sent_time = \
+                self._pending_rpc_requests.pop(seq_id)
+            self.stats.record_rpc_rtt(time.perf_counter() - sent_time)
+            if err:
+                if not error_handler:
+                    self._rpc_error(err)
+                    return
+                error_handler(err)
+            elif response_handler:
+                response_handler(ret_val)
+
+            self._send_queued_rpc_requests()
         except Exception as e:
             self._rpc_error(e)
 
-    def _send_next_rpc_request(self):
-        self._pending_rpc_request = self._rpc_request_queue.pop(0)
-        self._rpc_socket.request(self._pending_rpc_request[0],
-                                 self._got_rpc_response)
+    def _send_queued_rpc_requests(self):
+        while (self._rpc_request_queue and
+               len(self._pending_rpc_requests) < self._rpc_window_size):
+            seq_id, request, handlers = self._rpc_request_queue.pop(0)
+            self._pending_rpc_requests[seq_id] = handlers + (
+                time.perf_counter(),)
+            self._rpc_socket.send(request)
 
     def _send_heartbeat(self):
         if self._heartbeat_timeout_timer.isActive():
             # Still waiting for a previous heartbeat reply.
             return
 
+        self._heartbeat_sent_time = time.perf_counter()
         self._invoke_rpc('ping', [], self._got_heartbeat)
         self._heartbeat_timeout_timer.start(HEARTBEAT_TIMEOUT_MSECS)
 
     def _got_heartbeat(self, _):
         self._heartbeat_timeout_timer.stop()
+        self.stats.record_heartbeat_rtt(
+            time.perf_counter() - self._heartbeat_sent_time)
 
     def _heartbeat_timed_out(self):
         self._heartbeat_timeout_timer.stop()
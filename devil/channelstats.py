@@ -0,0 +1,159 @@
+"""
+Runtime statistics kept by every channel, to find out which one is
+responsible when the GUI gets sluggish.
+"""
+
+import time
+
+# Interval at which the rates are recomputed and ChannelBase.stats_updated is
+# emitted.
+STATS_INTERVAL_MSECS = 1000
+
+
+class ChannelStats:
+    """
+    Counters for a single channel.
+
+    The record_*() functions are called for every packet/RPC response and only
+    bump a few counters; all derived values (rates, averages) are computed
+    once per STATS_INTERVAL_MSECS by roll(). The attributes not prefixed with
+    total_ refer to the last such interval.
+    """
+
+    def __init__(self):
+        # Cumulative counts since the channel was created.
+        self.total_packets = {}
+        self.total_bytes = {}
+        self.total_coalesced_packets = 0
+        self.total_dropped_packets = 0
+
+        # Values for the last completed interval.
+        self.packets_per_sec = {}
+        self.bytes_per_sec = {}
+        self.decode_secs_per_packet = None
+        self.coalesced_packets_per_sec = 0
+        self.dropped_packets_per_sec = 0
+        self.rpc_rtt_secs = None
+        self.max_rpc_rtt_secs = None
+
+        # Snapshots provided by the channel on every roll().
+        self.rpc_queue_depth = 0
+        self.rpc_in_flight = 0
+
+        # Round trip time of the most recent heartbeat.
+        self.heartbeat_rtt_secs = None
+
+        self._interval_packets = 0
+        self._interval_decode_secs = 0.0
+        self._interval_coalesced = 0
+        self._interval_rpc_count = 0
+        self._interval_rpc_secs = 0.0
+        self._interval_max_rpc_secs = 0.0
+        self._last_total_packets = {}
+        self._last_total_bytes = {}
+        self._last_total_dropped = 0
+        self._last_roll_time = time.monotonic()
+
+    def record_packet(self, packet):
+        idx = packet.stream_idx
+        self.total_packets[idx] = self.total_packets.get(idx, 0) + 1
+        self.total_bytes[idx] = self.total_bytes.get(idx, 0) + \
+            packet.raw_samples.nbytes
+        self._interval_packets += 1
+        self._interval_decode_secs += packet.decode_secs
+
+    def record_coalesced_packet(self):
+        self.total_coalesced_packets += 1
+        self._interval_coalesced += 1
+
+    def record_rpc_rtt(self, secs):
+        self._interval_rpc_count += 1
+        self._interval_rpc_secs += secs
+        if secs > self._interval_max_rpc_secs:
+            self._interval_max_rpc_secs = secs
+
+    def record_heartbeat_rtt(self, secs):
+        self.heartbeat_rtt_secs = secs
+
+    def roll(self):
+        """Computes the values for the interval since the last call."""
+        now = time.monotonic()
+        elapsed = max(now - self._last_roll_time, 1e-6)
+        self._last_roll_time = now
+
+        def rates(totals, last):
+            return {idx: (count - last.get(idx, 0)) / elapsed
+                    for idx, count in totals.items()}
+
+        self.packets_per_sec = rates(self.total_packets,
+                                     self._last_total_packets)
+        self.bytes_per_sec = rates(self.total_bytes, self._last_total_bytes)
+        self._last_total_packets = dict(self.total_packets)
+        self._last_total_bytes = dict(self.total_bytes)
+
+        self.decode_secs_per_packet = None
+        if self._interval_packets:
+            self.decode_secs_per_packet = \
+                self._interval_decode_secs / self._interval_packets
+
+        self.coalesced_packets_per_sec = self._interval_coalesced / elapsed
+
+        self.dropped_packets_per_sec = \
+            (self.total_dropped_packets - self._last_total_dropped) / elapsed
+        self._last_total_dropped = self.total_dropped_packets
+
+        self.rpc_rtt_secs = None
+        self.max_rpc_rtt_secs = None
+        if self._interval_rpc_count:
+            self.rpc_rtt_secs = \
+                self._interval_rpc_secs / self._interval_rpc_count
+            self.max_rpc_rtt_secs = self._interval_max_rpc_secs
+
+        self._interval_packets = 0
+        self._interval_decode_secs = 0.0
+        self._interval_coalesced = 0
+        self._interval_rpc_count = 0
+        self._interval_rpc_secs = 0.0
+        self._interval_max_rpc_secs = 0.0
+
+    def summary(self):
+        """A short one-line description, e.g. for a table cell."""
+        parts = ['{:.0f} pkt/s'.format(sum(self.packets_per_sec.values())),
+                 '{:.2f} MB/s'.format(sum(self.bytes_per_sec.values()) / 1e6)]
+        if self.decode_secs_per_packet is not None:
+            parts.append('decode {:.0f} µs'.format(
+                self.decode_secs_per_packet * 1e6))
+        if self.heartbeat_rtt_secs is not None:
+            parts.append('RTT {:.1f} ms'.format(self.heartbeat_rtt_secs * 1e3))
+        if self.rpc_queue_depth:
+            parts.append('{} RPCs queued'.format(self.rpc_queue_depth))
+        if self.dropped_packets_per_sec:
+            parts.append('{:.0f} dropped/s'.format(
+                self.dropped_packets_per_sec))
+        return ', '.join(parts)
+
+    def details(self):
+        """A multi-line description of all values, e.g. for a tooltip."""
+        def ms(secs):
+            return '–' if secs is None else '{:.2f} ms'.format(secs * 1e3)
+
+        lines = []
+        for idx in sorted(self.total_packets):
+            lines.append('Stream {}: {:.1f} packets/s, {:.1f} kB/s '
+                         '({} packets total)'.format(
+                             idx, self.packets_per_sec.get(idx, 0),
+                             self.bytes_per_sec.get(idx, 0) / 1e3,
+                             self.total_packets[idx]))
+        lines.append('Decode time per packet: {}'.format(
+            ms(self.decode_secs_per_packet)))
+        lines.append('Coalesced packets: {:.1f}/s ({} total)'.format(
+            self.coalesced_packets_per_sec, self.total_coalesced_packets))
+        lines.append('Dropped packets: {:.1f}/s ({} total)'.format(
+            self.dropped_packets_per_sec, self.total_dropped_packets))
+        lines.append('RPC queue: {} queued, {} in flight'.format(
+            self.rpc_queue_depth, self.rpc_in_flight))
+        lines.append('RPC round trip: {} mean, {} max'.format(
+            ms(self.rpc_rtt_secs), ms(self.max_rpc_rtt_secs)))
+        lines.append('Heartbeat round trip: {}'.format(
+            ms(self.heartbeat_rtt_secs)))
+        return '\n'.join(lines)
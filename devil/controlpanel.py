@@ -69,6 +69,10 @@ class ControlPanel(QtG.QWidget):
         for v in self._streaming_views:
             v.got_packet(packet)
 
+    def accumulate_stream_packet(self, packet):
+        for v in self._streaming_views:
+            v.accumulate_packet(packet)
+
     def disconnected(self):
         self.errorConditionLabel.setText('(connection lost)')
 
@@ -2,6 +2,8 @@ from PyQt4 import QtCore as QtC
 from PyQt4 import QtGui as QtG
 from math import sqrt
 from devil.channel import Channel
+from devil.sparklinegrid import SparklineGrid
+import numpy as np
 import pyqtgraph as pg
 
 # Currently, we always display the stream with index 0 on the dashboard. This
@@ -17,18 +19,53 @@ COLOR_LABEL_BG_INACTIVE = (0, 43, 54)
 COLOR_LABEL_CONFIGURING = (133, 153, 0)
 COLOR_LABEL_RUNNING = (38, 139, 210)
 CSS_COLOR_ERROR = '#dc322f'
+COLOR_ERROR = (220, 50, 47)
+
+# Whether to draw all channels using a single SparklineGrid item instead of
+# one PlotItem per channel, unless specified when creating the dashboard. The
+# grid is much cheaper with many channels; the PlotItems draw antialiased
+# traces and offer pyqtgraph's export menu.
+SPARKLINE_GRID_SETTING = 'dashboard/sparklineGrid'
+
+# Resizing the window generates a stream of resize events; only relayout once
+# they have stopped for this long.
+RELAYOUT_DEBOUNCE_MSECS = 100
+
+
+def _min_max_decimate(samples, columns):
+    """
+    Reduces samples to the minimum and maximum of each of the given number of
+    columns, preserving peaks for display. The columns differ in size by at
+    most one sample, so that together they cover all of the samples.
+
+    Returns (x, y) with x in units of the original sample index, or None if
+    there are not enough samples to make decimation worthwhile.
+    """
+    if columns < 1 or len(samples) <= 2 * columns:
+        return None
+
+    starts = np.arange(columns) * len(samples) // columns
+
+    y = np.empty((columns, 2), dtype=samples.dtype)
+    np.minimum.reduceat(samples, starts, out=y[:, 0])
+    np.maximum.reduceat(samples, starts, out=y[:, 1])
+
+    x = np.repeat(starts, 2)
+    return x, y.reshape(-1)
 
 
 class Dashboard(QtG.QMainWindow):
     closed = QtC.pyqtSignal()
     hide_channel = QtC.pyqtSignal(object)
 
-    def __init__(self, version_string):
+    def __init__(self, version_string, use_sparkline_grid=None):
         QtG.QWidget.__init__(self)
 
         self._version_string = version_string
 
         settings = QtC.QSettings()
+        if use_sparkline_grid is None:
+            use_sparkline_grid = int(settings.value(SPARKLINE_GRID_SETTING, 1))
 
         saved_geometry = settings.value('dashboard/geometry')
         if saved_geometry:
@@ -43,20 +80,49 @@ class Dashboard(QtG.QMainWindow):
         self._view.setBackground(COLOR_BG)
         self.setCentralWidget(self._view)
 
+        layout = self._view.ci.layout
+        layout.setHorizontalSpacing(20)
+
+        # TODO: Set larger spacing below label. Somehow, layout.setRowSpacing
+        # only ever seems to add space before the very first row, though.
+        layout.setVerticalSpacing(10)
+
         self._guichannels = []
         self._channel_curve_map = {}
         self._channel_condition_text_map = {}
         self._channel_plot_map = {}
         self._channel_name_label_map = {}
 
+        # The grid cell (row, col) the plot of each channel is currently placed
+        # in; the name label is in the row below.
+        self._channel_cell_map = {}
+        self._col_count = 0
+        self._col_width = None
+
+        self._relayout_timer = QtC.QTimer()
+        self._relayout_timer.setSingleShot(True)
+        self._relayout_timer.timeout.connect(self._relayout)
+
+        self._grid = None
+        if use_sparkline_grid:
+            self._grid = SparklineGrid((-514, 514), COLOR_ERROR)
+            self._view.addItem(self._grid)
+
     def add_channel(self, channel):
         self.add_channels([channel])
 
     def add_channels(self, guichannels):
         for c in guichannels:
             c.channel.shutting_down.connect(self._channel_shutting_down)
-            c.channel.add_stream_subscription(STREAM_IDX_TO_DISPLAY)
+            c.channel.add_stream_subscription(STREAM_IDX_TO_DISPLAY,
+                                              coalesce=True)
             self._guichannels.append(c)
+            if self._grid:
+                self._add_cell_for_channel(c)
+            else:
+                self._add_plot_for_channel(c)
+                self._add_name_for_channel(c)
+            self._update_status_colors(c.channel, c.channel.current_status())
 
         self._relayout()
 
@@ -64,7 +130,8 @@ class Dashboard(QtG.QMainWindow):
             c.channel.error_conditions_changed.connect(
                 self._channel_conditions_changed)
             c.channel.status_changed.connect(self._channel_status_changed)
-            c.channel.stream_packet_received.connect(self._got_stream_packet)
+            c.channel.latest_stream_packet_received.connect(
+                self._got_stream_packet)
 
     def remove_channel(self, guichannel):
         c = guichannel.channel
@@ -72,14 +139,30 @@ class Dashboard(QtG.QMainWindow):
         c.error_conditions_changed.disconnect(
             self._channel_conditions_changed)
         c.status_changed.disconnect(self._channel_status_changed)
-        c.stream_packet_received.disconnect(self._got_stream_packet)
-        c.remove_stream_subscription(STREAM_IDX_TO_DISPLAY)
+        c.latest_stream_packet_received.disconnect(self._got_stream_packet)
+        c.remove_stream_subscription(STREAM_IDX_TO_DISPLAY, coalesce=True)
 
         self._guichannels.remove(guichannel)
-        self._relayout()
+
+        if self._grid:
+            self._grid.remove_cell(c)
+            return
+
+        scene = self._view.scene()
+        for item in (self._channel_plot_map.pop(c),
+                     self._channel_name_label_map.pop(c)):
+            self._remove_from_layout(item)
+            scene.removeItem(item)
+        del self._channel_curve_map[c]
+        del self._channel_condition_text_map[c]
+        del self._channel_cell_map[c]
+
+        # Removing and re-adding a channel (e.g. on reconnect) often happens
+        # in quick succession, so wait for things to settle.
+        self._relayout_timer.start(RELAYOUT_DEBOUNCE_MSECS)
 
     def resizeEvent(self, event):
-        self._relayout()
+        self._relayout_timer.start(RELAYOUT_DEBOUNCE_MSECS)
 
     def changeEvent(self, event):
         if event.type() == QtC.QEvent.WindowStateChange:
@@ -103,79 +186,105 @@ class Dashboard(QtG.QMainWindow):
         settings.setValue('dashboard/windowState', self.saveState())
 
         for gc in self._guichannels:
-            gc.channel.remove_stream_subscription(STREAM_IDX_TO_DISPLAY)
+            gc.channel.remove_stream_subscription(STREAM_IDX_TO_DISPLAY,
+                                                  coalesce=True)
 
         self.closed.emit()
         QtG.QMainWindow.closeEvent(self, event)
 
     def _relayout(self):
-        self._view.clear()
-        self._channel_curve_map.clear()
-        self._channel_condition_text_map.clear()
-        self._channel_plot_map.clear()
-        self._channel_name_label_map.clear()
+        """
+        Places the channels in a grid that roughly matches the window aspect
+        ratio.
+
+        The plot and label items are created once per channel and only moved
+        to a different cell if their position in the grid changes.
+        """
+        self._relayout_timer.stop()
+
+        # The grid item lays out its cells itself.
+        if self._grid:
+            return
 
         if not self._guichannels:
+            self._col_count = 0
             return
 
         layout = self._view.ci.layout
-        layout.setHorizontalSpacing(20)
-
-        # TODO: Set larger spacing below label. Somehow, layout.setRowSpacing
-        # only ever seems to add space before the very first row, though.
-        layout.setVerticalSpacing(10)
 
         window_aspect = self.width() / self.height()
         target_aspect = 1
 
         cols = round(sqrt(len(self._guichannels) * window_aspect / target_aspect))
-        cols = min(cols, len(self._guichannels))
-
-        last_row = len(self._guichannels) % cols
-        if last_row == 0:
-            last_row += cols
+        cols = max(1, min(cols, len(self._guichannels)))
 
         self._guichannels.sort(key=lambda a: a.channel.resource.display_name)
-        channel_iter = iter(self._guichannels + [None] * (cols - last_row))
-        for row in zip(*([channel_iter] * cols)):
-            for guichannel in row:
-                if not guichannel:
-                    break
-                self._add_plot_for_channel(guichannel)
-            self._view.nextRow()
-
-            for guichannel in row:
-                if not guichannel:
-                    break
-                self._add_name_for_channel(guichannel)
-                c = guichannel.channel
-                self._update_status_colors(c, c.current_status())
-            self._view.nextRow()
 
-        col_width = self.width() / cols - layout.horizontalSpacing()
-        for i in range(cols):
-            layout.setColumnFixedWidth(i, col_width)
+        moves = []
+        for i, guichannel in enumerate(self._guichannels):
+            c = guichannel.channel
+            cell = (2 * (i // cols), i % cols)
+            if self._channel_cell_map.get(c) != cell:
+                moves.append((c, cell))
+
+        # Take out all the items to be moved first, so that they never share
+        # a cell with an item that has not been moved yet.
+        for c, _ in moves:
+            if c in self._channel_cell_map:
+                self._remove_from_layout(self._channel_plot_map[c])
+                self._remove_from_layout(self._channel_name_label_map[c])
+        for c, (row, col) in moves:
+            layout.addItem(self._channel_plot_map[c], row, col)
+            layout.addItem(self._channel_name_label_map[c], row + 1, col)
+            self._channel_cell_map[c] = (row, col)
 
-        # Set maximum width so that overly long names do not break the grid
-        # layout, even if they obviously still look ugly.
-        for l in self._channel_name_label_map.values():
-            l.setMaximumWidth(col_width)
+        col_width = self.width() / cols - layout.horizontalSpacing()
+        if cols != self._col_count or col_width != self._col_width:
+            self._col_count = cols
+            self._col_width = col_width
+            for i in range(cols):
+                layout.setColumnFixedWidth(i, col_width)
+
+            # Set maximum width so that overly long names do not break the
+            # grid layout, even if they obviously still look ugly.
+            for l in self._channel_name_label_map.values():
+                l.setMaximumWidth(col_width)
+        elif moves:
+            for c, _ in moves:
+                self._channel_name_label_map[c].setMaximumWidth(col_width)
 
         # FIXME: For some weird reason, this causes the channel traces to
         # disappear (but not the name labels, etc.). Seems to be a pyqtgraph
         # bug.
         #
-        # self._view.nextRow()
         # self._version_label = pg.LabelItem(justify='left')
         # self._version_label.setText('DEVIL client v' + self._version_string,
         #                             bold=True,
         #                             color=QtG.QColor(*COLOR_VERSION_LINE))
-        # self._view.addItem(self._version_label, colspan=cols)
+        # layout.addItem(self._version_label, 2 * rows, 0, 1, cols)
+
+    def _remove_from_layout(self, item):
+        layout = self._view.ci.layout
+        for i in range(layout.count()):
+            if layout.itemAt(i).graphicsItem() is item:
+                layout.removeAt(i)
+                return
+
+    def _add_cell_for_channel(self, guichannel):
+        channel = guichannel.channel
+        self._grid.add_cell(channel, channel.resource.display_name, [
+            ('Open Control Panel...', guichannel.show_control_panel),
+            ('Unlock', channel.unlock),
+            ('Hide from Dashboard',
+             lambda gc=guichannel: self.hide_channel.emit(gc))
+        ])
+        self._update_condition_text(channel, channel.current_error_conditions())
 
     def _add_plot_for_channel(self, guichannel):
         channel = guichannel.channel
 
-        plot = self._view.addPlot()
+        # Placed in the grid by _relayout().
+        plot = pg.PlotItem()
         self._channel_plot_map[channel] = plot
         plot.setMouseEnabled(False, False)
         plot.hideButtons()
@@ -213,16 +322,26 @@ class Dashboard(QtG.QMainWindow):
     def _add_name_for_channel(self, guichannel):
         label = LabelItemWithBg(text=guichannel.channel.resource.display_name, bold=True)
         self._channel_name_label_map[guichannel.channel] = label
-        self._view.addItem(label)
 
     def _got_stream_packet(self, packet):
         if packet.stream_idx != STREAM_IDX_TO_DISPLAY:
             return
 
-        curve = self._channel_curve_map[self.sender()]
-        curve.setData(packet.samples)
+        if self._grid:
+            # Decimated to the cell width by the grid.
+            self._grid.set_samples(self.sender(), packet.samples)
+            return
 
+        curve = self._channel_curve_map[self.sender()]
         plot = self._channel_plot_map[self.sender()]
+
+        # The thumbnails are small, so there is no point in building a path
+        # with more than two points (min/max) per horizontal pixel.
+        decimated = _min_max_decimate(packet.samples, int(plot.vb.width()))
+        if decimated:
+            curve.setData(*decimated)
+        else:
+            curve.setData(packet.samples)
         plot.setXRange(0, len(packet.samples), padding=0)
 
     def _channel_conditions_changed(self, conditions):
@@ -230,6 +349,11 @@ class Dashboard(QtG.QMainWindow):
         self._update_condition_text(channel, conditions)
 
     def _update_condition_text(self, channel, error_conditions):
+        if self._grid:
+            self._grid.set_condition_text(channel, '  '.join(
+                e.short_name for e in error_conditions))
+            return
+
         text = '&nbsp;&nbsp;'.join(map(lambda e: e.short_name,
                                        error_conditions))
         html = '<span style="color: {}; font-weight: bold">{}</span>'.format(
@@ -240,23 +364,26 @@ class Dashboard(QtG.QMainWindow):
         self._update_status_colors(self.sender(), status)
 
     def _update_status_colors(self, channel, status):
-        curve = self._channel_curve_map[channel]
-        label = self._channel_name_label_map[channel]
-
         if status == Channel.Status.idle:
-            curve.setPen(pg.mkPen(COLOR_TRACE_INACTIVE))
-            label.setText(channel.resource.display_name, color=QtG.QColor(
-                *COLOR_TRACE_INACTIVE))
-            label.setBgColor(QtG.QColor(*COLOR_LABEL_BG_INACTIVE))
+            trace_color = COLOR_TRACE_INACTIVE
+            text_color = COLOR_TRACE_INACTIVE
+            bg_color = COLOR_LABEL_BG_INACTIVE
+        else:
+            trace_color = COLOR_TRACE_ACTIVE
+            bg_color = COLOR_LABEL_BG_ACTIVE
+            if status == Channel.Status.configuring:
+                text_color = COLOR_LABEL_CONFIGURING
+            if status == Channel.Status.running:
+                text_color = COLOR_LABEL_RUNNING
+
+        if self._grid:
+            self._grid.set_colors(channel, trace_color, text_color, bg_color)
             return
 
-        curve.setPen(pg.mkPen(COLOR_TRACE_ACTIVE))
-        label.setBgColor(QtG.QColor(*COLOR_LABEL_BG_ACTIVE))
-
-        if status == Channel.Status.configuring:
-            text_color = COLOR_LABEL_CONFIGURING
-        if status == Channel.Status.running:
-            text_color = COLOR_LABEL_RUNNING
+        curve = self._channel_curve_map[channel]
+        label = self._channel_name_label_map[channel]
+        curve.setPen(pg.mkPen(trace_color))
+        label.setBgColor(QtG.QColor(*bg_color))
         label.setText(channel.resource.display_name, color=QtG.QColor(
             *text_color))
 
@@ -5,8 +5,11 @@ from devil.dashboard import Dashboard
 from devil.guichannel import GuiChannel
 
 HEADER_SETTING = 'device_list_header'
+SHOW_STATS_SETTING = 'device_list_show_stats'
 IN_DASHBOARD_SETTINGS = 'show_in_dashboard/'
 
+STATS_COLUMN = 5
+
 
 class DeviceList(QtG.QWidget):
     closed = QtC.pyqtSignal()
@@ -27,6 +30,12 @@ class DeviceList(QtG.QWidget):
         self.forceRescanButton.clicked.connect(self.force_rescan)
         self.openDashboardButton.clicked.connect(self._open_dashboard)
 
+        show_stats = int(s.value(SHOW_STATS_SETTING, 0))
+        self.showStatisticsCheckBox.setChecked(show_stats)
+        self.deviceTableWidget.setColumnHidden(STATS_COLUMN, not show_stats)
+        self.showStatisticsCheckBox.stateChanged.connect(
+            self._show_stats_changed)
+
         self.guichannels = []
         self.guichannels_displayed = []
 
@@ -43,6 +52,7 @@ class DeviceList(QtG.QWidget):
         channel.connection_ready.connect(lambda: self._display_channel(guichannel))
         channel.shutting_down.connect(lambda: self._remove_channel(guichannel))
         channel.connection_failed.connect(self._channel_connection_failed)
+        channel.stats_updated.connect(lambda: self._update_stats(guichannel))
 
     def _channel_connection_failed(self, msg):
         QtC.qWarning('[{}] Connection failed: {}'.format(
@@ -87,6 +97,8 @@ class DeviceList(QtG.QWidget):
         open_button.clicked.connect(guichannel.show_control_panel)
         tw.setCellWidget(row, 4, open_button)
 
+        tw.setItem(row, STATS_COLUMN, QtG.QTableWidgetItem())
+
         # If the channel had been on the dashboard before and the dashboard is
         # open, immediately show it.
         if on_dashboard and self._dashboard:
@@ -100,6 +112,22 @@ class DeviceList(QtG.QWidget):
             self.guichannels_displayed.remove(guichannel)
         self.guichannels.remove(guichannel)
 
+    def _show_stats_changed(self, new_val):
+        QtC.QSettings().setValue(SHOW_STATS_SETTING, new_val)
+        self.deviceTableWidget.setColumnHidden(STATS_COLUMN, not new_val)
+
+    def _update_stats(self, guichannel):
+        if not self.showStatisticsCheckBox.isChecked():
+            return
+        if guichannel not in self.guichannels_displayed:
+            return
+
+        row = self.guichannels_displayed.index(guichannel)
+        item = self.deviceTableWidget.item(row, STATS_COLUMN)
+        stats = guichannel.channel.stats
+        item.setText(stats.summary())
+        item.setToolTip(stats.details())
+
     def _show_in_dashboard_changed(self, guichannel, new_val):
         s = QtC.QSettings()
         s.setValue(IN_DASHBOARD_SETTINGS + guichannel.channel.resource.dev_id,
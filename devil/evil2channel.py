@@ -42,8 +42,8 @@ def _sweep_timings(freq_reg_val):
 
 
 class Evil2Channel(Channel):
-    def __init__(self, zmq_ctx, host_addr, resource):
-        Channel.__init__(self, zmq_ctx, host_addr, resource)
+    def __init__(self, zmq_ctx, host_addr, resource, **kwargs):
+        Channel.__init__(self, zmq_ctx, host_addr, resource, **kwargs)
 
         self._system_control_reg = Register(0)
 
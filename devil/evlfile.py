@@ -0,0 +1,169 @@
+"""
+Random access to the stream snapshot (.evl) files written by the control
+panel.
+
+An .evl file is simply a sequence of records as written by np.save, one per
+snapshot. EvlFile scans the record headers once, caches the offsets, shapes and
+dtypes in a sidecar index file next to it, and returns memory-mapped views of
+the record data instead of reading it into memory.
+"""
+
+import json
+import numpy as np
+import os
+
+INDEX_FILE_SUFFIX = '.idx'
+INDEX_FORMAT_VERSION = 1
+
+
+class EvlFile:
+    """
+    Read-only view of a (possibly multi-GB) .evl snapshot file.
+
+    If the file has been appended to since the sidecar index was written, only
+    the new records are scanned.
+    """
+
+    def __init__(self, path, use_index_file=True):
+        self.path = path
+        self._index_path = path + INDEX_FILE_SUFFIX if use_index_file else None
+
+        # List of (data_offset, shape, dtype, fortran_order) tuples.
+        self._records = []
+        self._scanned_bytes = 0
+        self._mmap = None
+
+        self._load_index()
+        self.refresh()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.records(i.start, i.stop, i.step)
+        return self.record(i)
+
+    def refresh(self):
+        """Picks up records appended to the file since the last scan."""
+        size = os.path.getsize(self.path)
+        if size < self._scanned_bytes:
+            # File has been truncated or replaced, start from scratch.
+            self._records = []
+            self._scanned_bytes = 0
+
+        if size != self._scanned_bytes:
+            self._scan(size)
+            self._save_index()
+            self._mmap = None
+
+    def record(self, i):
+        """Returns a read-only memory-mapped view of the data of record i."""
+        offset, shape, dtype, fortran_order = self._records[i]
+        return np.ndarray(shape, dtype, self._buffer(), offset,
+                          order='F' if fortran_order else 'C')
+
+    def records(self, start=0, stop=None, step=None):
+        """
+        Returns the records selected by the slice [start:stop:step].
+
+        If they all have the same shape and dtype (the common case, as the
+        np.save headers then have the same length, too), the result is a
+        single strided view with the record index as the first axis, again
+        without copying any data. Otherwise, a list of per-record views is
+        returned.
+        """
+        indices = range(len(self._records))[start:stop:step]
+        recs = [self._records[i] for i in indices]
+        if not recs:
+            return []
+
+        offset, shape, dtype, fortran_order = recs[0]
+        uniform = all(r[1:] == recs[0][1:] for r in recs[1:])
+        if len(recs) > 1 and uniform and not fortran_order:
+            stride = recs[1][0] - offset
+            if all(b[0] - a[0] == stride for a, b in zip(recs, recs[1:])):
+                inner = np.ndarray(shape, dtype).strides
+                return np.ndarray((len(recs),) + shape, dtype, self._buffer(),
+                                  offset, strides=(stride,) + inner)
+
+        return [self.record(i) for i in indices]
+
+    def shapes(self):
+        return [r[1] for r in self._records]
+
+    def _buffer(self):
+        if self._mmap is None:
+            self._mmap = np.memmap(self.path, np.uint8, mode='r')
+        return self._mmap
+
+    def _scan(self, size):
+        with open(self.path, 'rb') as f:
+            f.seek(self._scanned_bytes)
+            while f.tell() < size:
+                try:
+                    version = np.lib.format.read_magic(f)
+                    if version == (1, 0):
+                        shape, fortran_order, dtype = \
+                            np.lib.format.read_array_header_1_0(f)
+                    else:
+                        shape, fortran_order, dtype = \
+                            np.lib.format.read_array_header_2_0(f)
+                except ValueError as e:
+                    if str(e).startswith('EOF'):
+                        # Header still being written.
+                        break
+                    raise
+                if dtype.hasobject:
+                    raise ValueError('Object arrays are not supported in {} '
+                                     '(record {})'.format(self.path,
+                                                          len(self._records)))
+
+                offset = f.tell()
+                end = offset + int(np.prod(shape)) * dtype.itemsize
+                if end > size:
+                    # Record still being written, pick it up next time.
+                    break
+
+                self._records.append((offset, shape, dtype, fortran_order))
+                f.seek(end)
+                self._scanned_bytes = end
+
+    def _load_index(self):
+        if not self._index_path or not os.path.exists(self._index_path):
+            return
+
+        try:
+            with open(self._index_path, 'r') as f:
+                index = json.load(f)
+            if index['version'] != INDEX_FORMAT_VERSION:
+                return
+            self._records = [(offset, tuple(shape),
+                              np.lib.format.descr_to_dtype(descr), fortran)
+                             for offset, shape, descr, fortran
+                             in index['records']]
+            self._scanned_bytes = index['scanned_bytes']
+        except (ValueError, KeyError, TypeError):
+            # Corrupt index, just rescan.
+            self._records = []
+            self._scanned_bytes = 0
+
+    def _save_index(self):
+        if not self._index_path:
+            return
+
+        index = {
+            'version': INDEX_FORMAT_VERSION,
+            'scanned_bytes': self._scanned_bytes,
+            'records': [(offset, shape, np.lib.format.dtype_to_descr(dtype),
+                         fortran) for offset, shape, dtype, fortran
+                        in self._records]
+        }
+        tmp_path = self._index_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self._index_path)
+        except OSError:
+            # The index is only a cache; the directory might be read-only.
+            pass
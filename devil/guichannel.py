@@ -13,8 +13,14 @@ class GuiChannel:
             self._control_panel.closed.connect(self._destroy_control_panel)
 
             # Channel -> Control Panel connections
-            self.channel.stream_packet_received.connect(
+            # The control panel only displays the streams, so skip any packets
+            # that arrive faster than they can be drawn.
+            self.channel.latest_stream_packet_received.connect(
                 self._control_panel.got_stream_packet)
+            # Accumulating displays (e.g. the persistence histogram) still need
+            # to see every packet, though.
+            self.channel.stream_packet_received.connect(
+                self._control_panel.accumulate_stream_packet)
             self.channel.stream_acquisition_config_changed.connect(
                 self._control_panel.set_stream_acquisition_config)
             self.channel.shutting_down.connect(self._control_panel.disconnected)
@@ -29,14 +35,20 @@ class GuiChannel:
             self._control_panel.stream_acquisition_config_changed.connect(
                 self.channel.set_stream_acquisition_config)
             self._control_panel.stream_subscription_added.connect(
-                self.channel.add_stream_subscription)
+                self._add_stream_subscription)
             for c in self._control_panel.active_stream_channels():
-                self.channel.add_stream_subscription(c)
+                self._add_stream_subscription(c)
             self._control_panel.stream_subscription_removed.connect(
-                self.channel.remove_stream_subscription)
+                self._remove_stream_subscription)
 
             self._control_panel.show()
 
+    def _add_stream_subscription(self, stream_idx):
+        self.channel.add_stream_subscription(stream_idx, coalesce=True)
+
+    def _remove_stream_subscription(self, stream_idx):
+        self.channel.remove_stream_subscription(stream_idx, coalesce=True)
+
     def _destroy_control_panel(self):
         self._control_panel.deleteLater()
         self._control_panel = None
@@ -0,0 +1,93 @@
+"""
+Accumulates stream packets into a decaying 2D histogram, like the persistence
+mode of a digital oscilloscope.
+"""
+
+import numpy as np
+import time
+
+# Resolution of the histogram along the time and amplitude axes.
+TIME_BINS = 512
+AMPLITUDE_BINS = 256
+
+# Time constant with which old packets fade out.
+DECAY_SECS = 2.0
+
+
+class PersistenceHistogram:
+    """
+    Density of the samples of all packets seen so far, binned by their
+    position in the packet and their value, with older packets exponentially
+    fading out.
+
+    All packets are assumed to span the same time range, so a sample is binned
+    by its index relative to the full packet length. Values outside of
+    y_range are clamped to the outermost bins.
+
+    The histogram is indexed as [time bin, amplitude bin], as expected by
+    pyqtgraph.ImageItem.
+    """
+
+    def __init__(self, y_range, time_bins=TIME_BINS,
+                 amplitude_bins=AMPLITUDE_BINS, decay_secs=DECAY_SECS):
+        self._y_min, y_max = y_range
+        self._amplitude_bins = amplitude_bins
+        self._amplitude_scale = amplitude_bins / (y_max - self._y_min)
+        self._time_bins = time_bins
+        self._decay_secs = decay_secs
+
+        self._counts = np.zeros((time_bins, amplitude_bins))
+        self._display = np.empty_like(self._counts)
+        self._last_add_time = None
+
+        # Flat index offset of the time bin for each sample index, cached as
+        # the packet length rarely changes.
+        self._time_offsets_key = None
+        self._time_offsets = None
+
+    def reset(self):
+        self._counts.fill(0)
+        self._last_add_time = None
+
+    def add(self, samples, packet_len=None):
+        """
+        Adds the given samples. If they are only the tail of a packet (e.g.
+        after triggering), packet_len is the length of the full packet.
+        """
+        n = len(samples)
+        if not n:
+            return
+        if packet_len is None:
+            packet_len = n
+
+        now = time.monotonic()
+        if self._last_add_time is not None:
+            self._counts *= np.exp((self._last_add_time - now) /
+                                   self._decay_secs)
+        self._last_add_time = now
+
+        idx = np.subtract(samples, self._y_min, dtype=float)
+        idx *= self._amplitude_scale
+        idx = idx.astype(np.intp)
+        np.clip(idx, 0, self._amplitude_bins - 1, out=idx)
+        idx += self._get_time_offsets(n, packet_len)
+
+        counts = np.bincount(idx, minlength=self._counts.size)
+        self._counts += counts.reshape(self._counts.shape)
+
+    def image(self):
+        """
+        Returns the histogram on a logarithmic scale, so single glitches stay
+        visible next to the bulk of the trace, along with the (min, max)
+        levels to display it with. The returned array is reused between calls.
+        """
+        np.log1p(self._counts, out=self._display)
+        return self._display, (0, max(1.0, self._display.max()))
+
+    def _get_time_offsets(self, n, packet_len):
+        key = (n, packet_len)
+        if key != self._time_offsets_key:
+            bins = np.arange(n) * self._time_bins // max(n, packet_len)
+            self._time_offsets = bins * self._amplitude_bins
+            self._time_offsets_key = key
+        return self._time_offsets
@@ -0,0 +1,198 @@
+"""
+Channel implementation that plays back previously saved stream data instead of
+talking to a device, e.g. to reproduce GUI performance problems offline.
+"""
+
+import fliquer
+import numpy as np
+import time
+from devil.channel import ChannelBase, StreamPacket, INT8ARRAY_SAMPLE_SCALE, \
+    MSGPACK_EXT_INT8ARRAY
+from devil.controlpanel import ControlPanel
+from devil.evil2channel import STREAM_NAMES
+from devil.evlfile import EvlFile
+from devil.streamarchive import load_chunk, chunk_paths
+from PyQt4 import QtCore as QtC
+from PyQt4 import QtGui as QtG
+
+REPLAY_DEV_TYPE = 'tiqi.devil.channel'
+
+DEFAULT_SAMPLE_INTERVAL_SECONDS = 1e-6
+
+
+def packet_from_samples(stream_idx, samples, sample_interval_seconds,
+                        trigger_offset=0, timestamp=None):
+    """
+    Creates a StreamPacket from samples in the hardware range (as returned by
+    StreamPacket.samples), quantizing them to the wire format.
+    """
+    raw = np.clip(np.round(np.asarray(samples) / INT8ARRAY_SAMPLE_SCALE),
+                  -128, 127).astype(np.int8)
+    return StreamPacket(stream_idx, sample_interval_seconds, trigger_offset,
+                        MSGPACK_EXT_INT8ARRAY, raw, timestamp)
+
+
+def packets_from_arrays(arrays, stream_idx=0,
+                        sample_interval_seconds=DEFAULT_SAMPLE_INTERVAL_SECONDS):
+    """
+    Yields one packet per 1D array (or per row of a 2D array) of samples.
+
+    If a 2D array is given, row i is replayed as stream stream_idx + i. As
+    plain arrays carry no timing information, the packets are timestamped as
+    if they had been acquired back to back.
+    """
+    t = 0
+    for a in arrays:
+        rows = np.atleast_2d(a)
+        for i, row in enumerate(rows):
+            yield packet_from_samples(stream_idx + i, row,
+                                      sample_interval_seconds, timestamp=t)
+        t += rows.shape[1] * sample_interval_seconds
+
+
+def packets_from_evl(path, **kwargs):
+    """Yields the snapshots of an .evl file; see packets_from_arrays."""
+    evl = EvlFile(path)
+    return packets_from_arrays((evl.record(i) for i in range(len(evl))),
+                               **kwargs)
+
+
+def packets_from_archive(directory):
+    """Yields the packets recorded by devil_recorder.py, in order."""
+    for path in chunk_paths(directory):
+        index, samples = load_chunk(path)
+        for row in index:
+            offset = row['sample_offset']
+            raw = samples[offset:offset + row['sample_count']]
+            yield StreamPacket(int(row['stream_idx']),
+                               float(row['sample_interval_seconds']),
+                               int(row['trigger_offset']),
+                               MSGPACK_EXT_INT8ARRAY, raw,
+                               float(row['timestamp']))
+
+
+class ReplayChannel(ChannelBase):
+    """
+    Replays a sequence of StreamPackets with their original timing scaled by
+    1/speed, or as fast as the event loop allows if speed is None.
+
+    Only packets for subscribed streams are emitted, like for a real device.
+    Status and error conditions can be changed by calling set_status() and
+    set_error_conditions().
+    """
+
+    def __init__(self, display_name, packets, speed=1.0, loop=False,
+                 status=ChannelBase.Status.running, error_conditions=()):
+        resource = fliquer.Resource(
+            REPLAY_DEV_TYPE, 'replay-{}'.format(display_name), display_name,
+            fliquer.SemVer(0, 0, 0, 'replay', None), 0)
+        ChannelBase.__init__(self, resource)
+
+        self._packets = list(packets)
+        self._speed = speed
+        self._loop = loop
+        self._status = status
+        self._error_conditions = list(error_conditions)
+
+        self._stream_acquisition_config = (0.0, 0)
+        if self._packets:
+            first = self._packets[0]
+            self._stream_acquisition_config = (
+                len(first) * first.sample_interval_seconds, len(first))
+
+        self._next_packet_idx = 0
+        self._timer = QtC.QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._emit_next_packet)
+
+    def start(self):
+        """Starts the replay and signals that the channel is ready."""
+        self.connection_ready.emit()
+        self.status_changed.emit(self._status)
+        self.error_conditions_changed.emit(self._error_conditions)
+        self._timer.start(0)
+
+    def stop(self):
+        self._timer.stop()
+        self._stop_timers()
+        self.shutting_down.emit()
+
+    def unlock(self):
+        self.set_status(ChannelBase.Status.idle)
+
+    def current_error_conditions(self):
+        return self._error_conditions
+
+    def current_status(self):
+        return self._status
+
+    def set_status(self, status):
+        if status != self._status:
+            self._status = status
+            self.status_changed.emit(status)
+
+    def set_error_conditions(self, conditions):
+        self._error_conditions = list(conditions)
+        self.error_conditions_changed.emit(self._error_conditions)
+
+    def set_stream_acquisition_config(self, time_span_seconds, points):
+        # Determined by the recorded data.
+        pass
+
+    def _start_stream(self, stream_idx):
+        pass
+
+    def _stop_stream(self, stream_idx):
+        pass
+
+    def _emit_next_packet(self):
+        if self._next_packet_idx == len(self._packets):
+            if not self._loop or not self._packets:
+                return
+            self._next_packet_idx = 0
+
+        packet = self._packets[self._next_packet_idx]
+        self._next_packet_idx += 1
+
+        if self._stream_subscriber_count.get(packet.stream_idx):
+            self._dispatch_stream_packet(StreamPacket(
+                packet.stream_idx, packet.sample_interval_seconds,
+                packet.trigger_offset, MSGPACK_EXT_INT8ARRAY,
+                packet.raw_samples, time.time()))
+
+        delay_msecs = 0
+        if self._speed:
+            if self._next_packet_idx < len(self._packets):
+                next_packet = self._packets[self._next_packet_idx]
+                delay = next_packet.timestamp - packet.timestamp
+            else:
+                # Wrapping around when looping; just wait for the duration of
+                # the last packet.
+                delay = len(packet) * packet.sample_interval_seconds
+            delay_msecs = max(0, int(delay / self._speed * 1000))
+        self._timer.start(delay_msecs)
+
+
+class ReplayRegisterArea(QtG.QWidget):
+    """Empty stand-in for the register area in replay control panels."""
+
+    extra_plot_items_changed = QtC.pyqtSignal(dict)
+
+    def load_settings(self, settings):
+        pass
+
+    def save_settings(self):
+        return {}
+
+    def extra_plot_items(self):
+        return {}
+
+
+def create_replay_control_panel(version_string, channel):
+    cp = ControlPanel(version_string, channel.resource.display_name,
+                      STREAM_NAMES, ReplayRegisterArea())
+
+    cp.set_error_conditions(channel.current_error_conditions())
+    channel.error_conditions_changed.connect(cp.set_error_conditions)
+
+    return cp
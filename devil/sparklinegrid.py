@@ -0,0 +1,251 @@
+from math import sqrt
+import numpy as np
+import pyqtgraph as pg
+from PyQt4 import QtCore as QtC
+from PyQt4 import QtGui as QtG
+
+SPACING_H = 20
+SPACING_V = 10
+
+# Padding around the text in the name labels.
+LABEL_PADDING = 2
+
+
+class _Cell:
+    def __init__(self, label, menu_actions):
+        self.label = label
+        self.menu_actions = menu_actions
+        self.samples = None
+        self.trace_color = None
+        self.label_color = None
+        self.label_bg_color = None
+        self.condition_text = ''
+
+        # Assigned by SparklineGrid._relayout().
+        self.trace_rect = QtC.QRectF()
+        self.label_rect = QtC.QRectF()
+        self.slots = slice(0, 0)
+
+
+class SparklineGrid(pg.GraphicsWidget):
+    """
+    Displays a grid of small traces with a name label each, like a grid of
+    PlotItems with hidden axes, but much cheaper.
+
+    All traces are decimated to two points per horizontal pixel and written
+    into one vertex buffer in item coordinates, from which a single path per
+    trace color is built and drawn in one paint pass.
+
+    Cells are identified by an arbitrary hashable key and sorted by label.
+    menu_actions is a list of (text, callable) pairs shown in the context menu
+    of the cell. Colors are given as RGB tuples.
+
+    Antialiasing is off by default, as it makes up most of the drawing time
+    for a large number of traces.
+    """
+
+    def __init__(self, y_range, condition_color=(255, 0, 0), target_aspect=1,
+                 antialias=False):
+        pg.GraphicsWidget.__init__(self)
+
+        self._y_range = y_range
+        self._condition_color = condition_color
+        self._antialias = antialias
+        self._target_aspect = target_aspect
+
+        self._cells = {}
+        self._ordered_cells = []
+
+        self._x = np.empty(0)
+        self._y = np.empty(0)
+        self._connect = np.empty(0, dtype=np.int32)
+
+        self._paths = None
+        self._menu = None
+
+        self._label_font = QtG.QFont()
+        self._label_font.setBold(True)
+        self._condition_font = QtG.QFont(self._label_font)
+
+    def add_cell(self, key, label, menu_actions):
+        self._cells[key] = _Cell(label, menu_actions)
+        self._relayout()
+
+    def remove_cell(self, key):
+        del self._cells[key]
+        self._relayout()
+
+    def set_samples(self, key, samples):
+        cell = self._cells[key]
+        cell.samples = samples
+        self._fill_slots(cell)
+        self._paths = None
+        self.update(cell.trace_rect)
+
+    def set_colors(self, key, trace_color, label_color, label_bg_color):
+        cell = self._cells[key]
+        cell.trace_color = trace_color
+        cell.label_color = label_color
+        cell.label_bg_color = label_bg_color
+        self._paths = None
+        self.update()
+
+    def set_condition_text(self, key, text):
+        cell = self._cells[key]
+        cell.condition_text = text
+        self.update(cell.trace_rect)
+
+    def resizeEvent(self, event):
+        self._relayout()
+
+    def boundingRect(self):
+        return self.rect()
+
+    def paint(self, p, *args):
+        if self._paths is None:
+            self._build_paths()
+
+        p.setRenderHint(p.Antialiasing, self._antialias)
+        for color, path in self._paths:
+            p.setPen(pg.mkPen(color))
+            p.drawPath(path)
+
+        fm = QtG.QFontMetrics(self._label_font)
+        for cell in self._ordered_cells:
+            if cell.label_bg_color is not None:
+                p.fillRect(cell.label_rect, QtG.QColor(*cell.label_bg_color))
+            p.setFont(self._label_font)
+            p.setPen(pg.mkPen(cell.label_color or 'w'))
+            text_rect = cell.label_rect.adjusted(
+                LABEL_PADDING, 0, -LABEL_PADDING, 0)
+            # Elide overly long names so they do not spill into the next cell.
+            text = fm.elidedText(cell.label, QtC.Qt.ElideRight,
+                                 int(text_rect.width()))
+            p.drawText(text_rect, QtC.Qt.AlignCenter, text)
+
+            if cell.condition_text:
+                p.setFont(self._condition_font)
+                p.setPen(pg.mkPen(self._condition_color))
+                p.drawText(cell.trace_rect, QtC.Qt.AlignLeft | QtC.Qt.AlignTop,
+                           cell.condition_text)
+
+    def mouseClickEvent(self, ev):
+        if ev.button() != QtC.Qt.RightButton:
+            return
+
+        cell = self._cell_at(ev.pos())
+        if not cell or not cell.menu_actions:
+            return
+
+        # Keep a reference, as the menu would otherwise be garbage collected
+        # while being shown.
+        self._menu = QtG.QMenu()
+        for text, fn in cell.menu_actions:
+            action = self._menu.addAction(text)
+            action.triggered.connect(lambda *args, fn=fn: fn())
+        pos = ev.screenPos()
+        self._menu.popup(QtC.QPoint(pos.x(), pos.y()))
+        ev.accept()
+
+    def _cell_at(self, pos):
+        for cell in self._ordered_cells:
+            if cell.trace_rect.contains(pos) or cell.label_rect.contains(pos):
+                return cell
+        return None
+
+    def _relayout(self):
+        self._ordered_cells = sorted(self._cells.values(),
+                                     key=lambda c: c.label)
+        count = len(self._ordered_cells)
+        self._paths = None
+        self.update()
+        if not count:
+            self._x = np.empty(0)
+            self._y = np.empty(0)
+            self._connect = np.empty(0, dtype=np.int32)
+            return
+
+        width = self.size().width()
+        height = self.size().height()
+        aspect = width / height if height > 0 else 1
+
+        cols = round(sqrt(count * aspect / self._target_aspect))
+        cols = max(1, min(cols, count))
+        rows = (count + cols - 1) // cols
+
+        label_height = QtG.QFontMetrics(self._label_font).height() + \
+            2 * LABEL_PADDING
+        cell_width = max(1, (width - (cols - 1) * SPACING_H) / cols)
+        cell_height = max(label_height + 1,
+                          (height - (rows - 1) * SPACING_V) / rows)
+        trace_height = cell_height - label_height
+
+        # Two points (min/max) per horizontal pixel of each trace.
+        slots_per_cell = 2 * max(1, int(cell_width))
+        total_slots = slots_per_cell * count
+        self._x = np.empty(total_slots)
+        self._y = np.empty(total_slots)
+        self._connect = np.ones(total_slots, dtype=np.int32)
+
+        cell_x = np.repeat(np.arange(slots_per_cell // 2), 2).astype(float)
+        for i, cell in enumerate(self._ordered_cells):
+            left = (i % cols) * (cell_width + SPACING_H)
+            top = (i // cols) * (cell_height + SPACING_V)
+            cell.trace_rect = QtC.QRectF(left, top, cell_width, trace_height)
+            cell.label_rect = QtC.QRectF(left, top + trace_height, cell_width,
+                                         label_height)
+
+            start = i * slots_per_cell
+            cell.slots = slice(start, start + slots_per_cell)
+            self._x[cell.slots] = cell_x + left
+            # Do not connect the last point to the next cell.
+            self._connect[start + slots_per_cell - 1] = 0
+            self._fill_slots(cell)
+
+    def _fill_slots(self, cell):
+        y = self._y[cell.slots]
+        rect = cell.trace_rect
+        samples = cell.samples
+
+        if samples is None or not len(samples):
+            return
+
+        columns = len(y) // 2
+        if len(samples) >= columns:
+            # Spread the column boundaries over all samples, so that the
+            # columns differ in size by at most one and none are left over.
+            starts = np.arange(columns) * len(samples) // columns
+            yy = y.reshape(columns, 2)
+            np.minimum.reduceat(samples, starts, out=yy[:, 0])
+            np.maximum.reduceat(samples, starts, out=yy[:, 1])
+        else:
+            # Fewer samples than pixels: stretch them across the cell,
+            # leaving zero-length segments in between.
+            idx = np.arange(len(y)) * len(samples) // len(y)
+            y[:] = samples[idx]
+
+        # Map the sample values to item coordinates, clipping them to the
+        # cell.
+        y_min, y_max = self._y_range
+        scale = rect.height() / (y_max - y_min)
+        np.clip(y, y_min, y_max, out=y)
+        y -= y_max
+        y *= -scale
+        y += rect.top()
+
+    def _build_paths(self):
+        self._paths = []
+        if not len(self._x):
+            return
+
+        by_color = {}
+        for cell in self._ordered_cells:
+            if cell.samples is None or not len(cell.samples):
+                continue
+            color = cell.trace_color or (255, 255, 255)
+            by_color.setdefault(color, []).append(cell.slots)
+
+        for color, slots in by_color.items():
+            idx = np.concatenate([np.arange(s.start, s.stop) for s in slots])
+            self._paths.append((color, pg.arrayToQPath(
+                self._x[idx], self._y[idx], self._connect[idx])))
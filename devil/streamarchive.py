@@ -0,0 +1,227 @@
+"""
+Chunked on-disk archive of raw stream packets.
+
+An archive is a directory containing one chunk per rotation interval. While
+being written, a chunk is a directory holding
+
+ - samples.i8: the raw int8 samples of all packets, concatenated,
+ - index.bin: one INDEX_DTYPE record per packet, in order of reception,
+ - meta.json: format version, dtypes and the resource the data came from.
+
+Both data files are headerless and can be memory-mapped directly (see
+load_chunk). Finished chunks can optionally be compressed into a single
+.npz file with 'index' and 'samples' arrays, which load_chunk reads as well.
+"""
+
+import json
+import numpy as np
+import os
+import shutil
+import threading
+import time
+
+from devil.channel import INT8ARRAY_SAMPLE_SCALE
+
+FORMAT_VERSION = 1
+
+INDEX_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('sample_interval_seconds', '<f8'),
+    ('sample_offset', '<i8'),
+    ('sample_count', '<i4'),
+    ('trigger_offset', '<i4'),
+    ('stream_idx', 'u1')
+])
+
+SAMPLES_FILE_NAME = 'samples.i8'
+INDEX_FILE_NAME = 'index.bin'
+META_FILE_NAME = 'meta.json'
+CHUNK_NAME_FORMAT = 'chunk-{:06d}'
+COMPRESSED_CHUNK_SUFFIX = '.npz'
+
+DEFAULT_CHUNK_SECS = 10 * 60
+DEFAULT_CHUNK_BYTES = 512 * 2**20
+
+
+class ArchiveWriter:
+    """
+    Appends StreamPackets to an archive, starting a new chunk every
+    chunk_secs or once the current chunk holds chunk_bytes of samples.
+
+    If max_chunks is given, the oldest chunks are deleted to keep at most that
+    many. Compression of finished chunks happens on a background thread;
+    chunks that are still being compressed are only deleted on a later
+    rotation.
+    """
+
+    def __init__(self, directory, resource=None,
+                 chunk_secs=DEFAULT_CHUNK_SECS,
+                 chunk_bytes=DEFAULT_CHUNK_BYTES, max_chunks=None,
+                 compress=False):
+        self._directory = directory
+        self._resource = resource
+        self._chunk_secs = chunk_secs
+        self._chunk_bytes = chunk_bytes
+        self._max_chunks = max_chunks
+        self._compress = compress
+
+        os.makedirs(directory, exist_ok=True)
+        existing = chunk_paths(directory)
+        self._next_chunk_number = (_chunk_number(existing[-1]) + 1
+                                   if existing else 0)
+
+        self._chunk_path = None
+        self._samples_file = None
+        self._index_file = None
+        self._chunk_started = None
+        self._index_row = np.zeros(1, INDEX_DTYPE)
+
+        # Compression thread by (uncompressed) chunk path.
+        self._compress_threads = {}
+
+    def write(self, packet):
+        if self._chunk_path is None or self._rotation_due():
+            self._start_chunk()
+
+        row = self._index_row[0]
+        row['timestamp'] = packet.timestamp
+        row['sample_interval_seconds'] = packet.sample_interval_seconds
+        row['sample_offset'] = self._samples_file.tell()
+        row['sample_count'] = len(packet.raw_samples)
+        row['trigger_offset'] = packet.trigger_offset
+        row['stream_idx'] = packet.stream_idx
+
+        self._samples_file.write(packet.raw_samples)
+        self._index_file.write(self._index_row)
+
+    def flush(self):
+        if self._chunk_path is not None:
+            self._samples_file.flush()
+            self._index_file.flush()
+
+    def close(self):
+        if self._chunk_path is not None:
+            self._finish_chunk()
+        for t in self._compress_threads.values():
+            t.join()
+
+    def _rotation_due(self):
+        return (time.time() - self._chunk_started >= self._chunk_secs or
+                self._samples_file.tell() >= self._chunk_bytes)
+
+    def _start_chunk(self):
+        if self._chunk_path is not None:
+            self._finish_chunk()
+
+        path = os.path.join(self._directory, CHUNK_NAME_FORMAT.format(
+            self._next_chunk_number))
+        self._next_chunk_number += 1
+        os.makedirs(path)
+
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'index_dtype': INDEX_DTYPE.descr,
+            'sample_dtype': 'i1',
+            'sample_scale': INT8ARRAY_SAMPLE_SCALE
+        }
+        if self._resource:
+            meta['dev_id'] = self._resource.dev_id
+            meta['display_name'] = self._resource.display_name
+        with open(os.path.join(path, META_FILE_NAME), 'w') as f:
+            json.dump(meta, f)
+
+        self._chunk_path = path
+        self._samples_file = open(os.path.join(path, SAMPLES_FILE_NAME), 'wb')
+        self._index_file = open(os.path.join(path, INDEX_FILE_NAME), 'wb')
+        self._chunk_started = time.time()
+
+        self._remove_old_chunks()
+
+    def _finish_chunk(self):
+        self._samples_file.close()
+        self._index_file.close()
+        path = self._chunk_path
+        self._chunk_path = None
+
+        if self._compress:
+            t = threading.Thread(target=compress_chunk, args=(path,))
+            t.start()
+            self._compress_threads[path] = t
+
+    def _remove_old_chunks(self):
+        if self._max_chunks is None:
+            return
+
+        self._compress_threads = {p: t for p, t in
+                                  self._compress_threads.items()
+                                  if t.is_alive()}
+
+        paths = chunk_paths(self._directory)
+        for path in paths[:max(0, len(paths) - self._max_chunks)]:
+            if path in self._compress_threads:
+                # Still being read by the compression thread.
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+def chunk_paths(directory):
+    """Returns the paths of all chunks in the archive, oldest first."""
+    names_by_number = {}
+    for n in os.listdir(directory):
+        if not n.startswith(CHUNK_NAME_FORMAT.split('{')[0]) or '.tmp' in n:
+            continue
+        # Right after compression, both the directory and the .npz file exist
+        # until the former is removed; the latter is already complete.
+        number = _chunk_number(n)
+        if (number not in names_by_number or
+                n.endswith(COMPRESSED_CHUNK_SUFFIX)):
+            names_by_number[number] = n
+    return [os.path.join(directory, names_by_number[k])
+            for k in sorted(names_by_number)]
+
+
+def compress_chunk(path):
+    """Converts a finished chunk directory into a compressed .npz file."""
+    index, samples = load_chunk(path)
+    tmp_path = path + '.tmp' + COMPRESSED_CHUNK_SUFFIX
+    np.savez_compressed(tmp_path, index=index, samples=samples)
+    os.rename(tmp_path, path + COMPRESSED_CHUNK_SUFFIX)
+    shutil.rmtree(path)
+
+
+def load_chunk(path):
+    """
+    Returns the (index, samples) arrays of a chunk. For uncompressed chunks,
+    both are read-only memory maps of the files on disk.
+
+    The raw int8 samples of packet i are
+    samples[index['sample_offset'][i]:][:index['sample_count'][i]]; multiply
+    by INT8ARRAY_SAMPLE_SCALE to get the values StreamPacket.samples returns.
+    """
+    if path.endswith(COMPRESSED_CHUNK_SUFFIX):
+        with np.load(path) as f:
+            return f['index'], f['samples']
+
+    # A chunk might have been cut short by a crash while writing, so only
+    # use complete index records.
+    index_path = os.path.join(path, INDEX_FILE_NAME)
+    count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+    return (_memmap(index_path, INDEX_DTYPE, count),
+            _memmap(os.path.join(path, SAMPLES_FILE_NAME), np.int8))
+
+
+def _memmap(path, dtype, count=None):
+    if count is None:
+        count = os.path.getsize(path) // np.dtype(dtype).itemsize
+    if count == 0:
+        # mmap cannot map empty files.
+        return np.empty(0, dtype)
+    return np.memmap(path, dtype, mode='r', shape=(count,))
+
+
+def _chunk_number(path):
+    name = os.path.basename(path)
+    return int(name.split('-')[1].split('.')[0])
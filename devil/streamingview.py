@@ -1,17 +1,40 @@
+from devil.persistence import PersistenceHistogram
+from devil.stripchart import StripChartHistory, DEFAULT_HISTORY_SECS
 import numpy as np
 import pyqtgraph as pg
 from PyQt4 import QtCore as QtC
 from PyQt4 import QtGui as QtG
 from PyQt4.uic import loadUi
+import time
+
+Y_RANGE = (-513, 513)
+
+# Packets are accumulated into the persistence histogram as they arrive, but
+# the image is only re-rendered at this interval.
+PERSISTENCE_REFRESH_MSECS = 40
+
+# Color map for the persistence display, from rarely to frequently hit bins.
+PERSISTENCE_COLORS = [(0, 0, 0), (0, 0, 160), (0, 180, 0), (255, 255, 0),
+                      (255, 255, 255)]
+
+# Interval at which the strip chart is scrolled.
+STRIP_CHART_REFRESH_MSECS = 100
+
+STRIP_CHART_ENVELOPE_COLOR = (80, 80, 160)
 
 
 class StreamingView(QtG.QWidget):
-    """A streaming plot view and associated controls."""
+    """
+    A streaming plot view and associated controls.
+
+    strip_chart_secs is the length of the history shown in strip chart mode.
+    """
 
     channel_changed = QtC.pyqtSignal(int, int)
     removed = QtC.pyqtSignal()
 
-    def __init__(self, channel_names, initial_channel=0):
+    def __init__(self, channel_names, initial_channel=0,
+                 strip_chart_secs=DEFAULT_HISTORY_SECS):
         QtG.QWidget.__init__(self)
         loadUi('ui/streamingchannel.ui', self)
 
@@ -29,16 +52,49 @@ class StreamingView(QtG.QWidget):
 
         pi = self.plotWidget.getPlotItem()
         self._last_x_range = 1.0
-        pi.setRange(xRange=(0, self._last_x_range), yRange=(-513, 513),
+        pi.setRange(xRange=(0, self._last_x_range), yRange=Y_RANGE,
                     padding=0)
         pi.setLabel('bottom', 'time', 's')
-        self._plot_curve = pi.plot(antialias=True)
+        # Acquisitions can be far longer than the plot is wide; only draw the
+        # envelope per pixel column.
+        self._plot_curve = pi.plot(antialias=True, pixelDecimation=True)
+
+        self._persistence = PersistenceHistogram(Y_RANGE)
+        self._persistence_image = pg.ImageItem()
+        self._persistence_image.setZValue(-1)
+        self._persistence_image.setLookupTable(pg.ColorMap(
+            np.linspace(0, 1, len(PERSISTENCE_COLORS)),
+            PERSISTENCE_COLORS).getLookupTable())
+        self._persistence_image.hide()
+        pi.addItem(self._persistence_image)
+        self._persistence_dirty = False
+        self._persistence_timer = QtC.QTimer(self)
+        self._persistence_timer.setInterval(PERSISTENCE_REFRESH_MSECS)
+        self._persistence_timer.timeout.connect(self._refresh_persistence)
+        self.persistenceCheckBox.toggled.connect(self._set_persistence)
+
+        # Per-packet summaries for each stream index, recorded while the strip
+        # chart is shown.
+        self._strip_chart_secs = strip_chart_secs
+        self._strip_chart_histories = {}
+        self._strip_chart_envelope = pg.PlotCurveItem(
+            pen=STRIP_CHART_ENVELOPE_COLOR)
+        self._strip_chart_mean = pg.PlotCurveItem(pen='w')
+        for item in (self._strip_chart_envelope, self._strip_chart_mean):
+            item.hide()
+            pi.addItem(item)
+        self._strip_chart_timer = QtC.QTimer(self)
+        self._strip_chart_timer.setInterval(STRIP_CHART_REFRESH_MSECS)
+        self._strip_chart_timer.timeout.connect(self._refresh_strip_chart)
+        self.stripChartCheckBox.toggled.connect(self._set_strip_chart)
 
         self._can_trigger = True
         self._extra_plot_items = {}
         self._displayed_extra_items = []
         self.rampTriggerCheckBox.stateChanged.connect(
             self._add_extra_items_from_dict)
+        self.rampTriggerCheckBox.stateChanged.connect(
+            self._reset_persistence)
 
     @property
     def channel(self):
@@ -49,30 +105,46 @@ class StreamingView(QtG.QWidget):
         self.removeViewButton.setEnabled(can_remove)
 
     def got_packet(self, packet):
+        """
+        Displays the given packet.
+
+        Only the most recent packets need to be passed here; see
+        accumulate_packet() for the displays built from every packet.
+        """
         if packet.stream_idx != self.channel:
             return
 
-        samples = packet.samples
-        interval = packet.sample_interval_seconds
+        self._update_x_range(packet)
 
-        pi = self.plotWidget.getPlotItem()
+        # The sample times are implied by the interval, which lets the curve
+        # reuse its x array and bounds between packets.
+        self._plot_curve.setData(y=self._triggered_samples(packet), x0=0,
+                                 dx=packet.sample_interval_seconds)
 
-        x_range = len(samples) * interval
+    def accumulate_packet(self, packet):
+        """
+        Adds the given packet to the strip chart history and the persistence
+        histogram.
 
-        if x_range != self._last_x_range:
-            self._last_x_range = x_range
-            pi.setRange(xRange=(0, self._last_x_range), padding = 0)
-            self._add_extra_items_from_dict()
+        Unlike got_packet(), this should be called for every received packet,
+        as skipping any would hide rare events from the display.
+        """
+        if self._strip_chart_enabled():
+            history = self._strip_chart_histories.get(packet.stream_idx)
+            if history is None:
+                history = StripChartHistory(self._strip_chart_secs)
+                self._strip_chart_histories[packet.stream_idx] = history
+            history.append(time.monotonic(), packet.samples)
 
-        if self._use_trigger():
-            try:
-                samples = samples[packet.trigger_offset:]
-            except IndexError:
-                QtC.qCritical('Invalid trigger offset {} (have: {} samples)'.
-                              format(packet.trigger_offset, len(samples)))
+        if packet.stream_idx != self.channel:
+            return
+        if not self.persistenceCheckBox.isChecked():
+            return
 
-        sample_times = np.linspace(0, (len(samples) - 1) * interval, len(samples))
-        self._plot_curve.setData(sample_times, samples)
+        self._update_x_range(packet)
+        self._persistence.add(self._triggered_samples(packet),
+                              len(packet.samples))
+        self._persistence_dirty = True
 
     def current_data(self):
         return self._plot_curve.getData()[1]
@@ -94,15 +166,108 @@ class StreamingView(QtG.QWidget):
     def _use_trigger(self):
         return self._can_trigger and self.rampTriggerCheckBox.isChecked()
 
+    def _update_x_range(self, packet):
+        x_range = len(packet.samples) * packet.sample_interval_seconds
+
+        if x_range != self._last_x_range:
+            self._last_x_range = x_range
+            self._set_x_range()
+            self._add_extra_items_from_dict()
+            self._reset_persistence()
+
+    def _triggered_samples(self, packet):
+        samples = packet.samples
+        if self._use_trigger():
+            try:
+                samples = samples[packet.trigger_offset:]
+            except IndexError:
+                QtC.qCritical('Invalid trigger offset {} (have: {} samples)'.
+                              format(packet.trigger_offset, len(samples)))
+        return samples
+
     def _change_channel(self, new_idx):
         old_idx = self._current_channel
 
         self._current_channel = new_idx
         self._plot_curve.clear()
         self._add_extra_items_from_dict()
+        self._reset_persistence()
 
         self.channel_changed.emit(old_idx, new_idx)
 
+    def _strip_chart_enabled(self):
+        return self.stripChartCheckBox.isChecked()
+
+    def _set_x_range(self):
+        pi = self.plotWidget.getPlotItem()
+        if self._strip_chart_enabled():
+            pi.setRange(xRange=(-self._strip_chart_secs, 0), padding=0)
+        else:
+            pi.setRange(xRange=(0, self._last_x_range), padding=0)
+
+    def _set_strip_chart(self, enable):
+        if enable:
+            self.persistenceCheckBox.setChecked(False)
+        else:
+            self._strip_chart_histories = {}
+
+        self._plot_curve.setVisible(not enable)
+        self._strip_chart_envelope.setVisible(enable)
+        self._strip_chart_mean.setVisible(enable)
+        if enable:
+            self._strip_chart_timer.start()
+        else:
+            self._strip_chart_timer.stop()
+        self._set_x_range()
+        self._add_extra_items_from_dict()
+
+    def _refresh_strip_chart(self):
+        history = self._strip_chart_histories.get(self.channel)
+        if not history:
+            self._strip_chart_envelope.clear()
+            self._strip_chart_mean.clear()
+            return
+
+        # About one entry per pixel column is enough; the pyramid levels
+        # already carry the extrema of the packets in between.
+        vb = self.plotWidget.getPlotItem().getViewBox()
+        t, lo, mean, hi = history.get(max(1, int(vb.width())))
+        t = t - time.monotonic()
+
+        # Draw the envelope as a vertical line from minimum to maximum per
+        # entry.
+        self._strip_chart_envelope.setData(
+            x=np.repeat(t, 2), y=np.column_stack((lo, hi)).ravel(),
+            connect='pairs')
+        self._strip_chart_mean.setData(x=t, y=mean)
+
+    def _set_persistence(self, enable):
+        if enable:
+            self.stripChartCheckBox.setChecked(False)
+        self._reset_persistence()
+        self._plot_curve.setVisible(not enable)
+        self._persistence_image.setVisible(enable)
+        if enable:
+            self._persistence_timer.start()
+        else:
+            self._persistence_timer.stop()
+
+    def _reset_persistence(self):
+        self._persistence.reset()
+        self._persistence_dirty = True
+
+    def _refresh_persistence(self):
+        if not self._persistence_dirty:
+            return
+        self._persistence_dirty = False
+
+        image, levels = self._persistence.image()
+        self._persistence_image.setImage(image, autoLevels=False,
+                                         levels=levels)
+        y_min, y_max = Y_RANGE
+        self._persistence_image.setRect(QtC.QRectF(
+            0, y_min, self._last_x_range, y_max - y_min))
+
     def _add_extra_items_from_dict(self):
         for item in self._displayed_extra_items:
             self.plotWidget.getPlotItem().removeItem(item)
@@ -123,7 +288,8 @@ class StreamingView(QtG.QWidget):
                 pg.InfiniteLine(-offset, angle=0))
 
         period = items.get('period')
-        if period is not None and self._use_trigger():
+        if period is not None and self._use_trigger() and \
+                not self._strip_chart_enabled():
             main_period, extra_divisions = period
 
             period_count = int(np.ceil(self._last_x_range / main_period))
@@ -0,0 +1,113 @@
+"""
+History of per-packet summary values for the strip chart display.
+"""
+
+import numpy as np
+
+# Length of the history shown by default.
+DEFAULT_HISTORY_SECS = 600
+
+# Upper bound for the packet rate the history is sized for; at higher rates,
+# the oldest packets are dropped before history_secs have passed.
+MAX_PACKETS_PER_SEC = 100
+
+# Coarser pyramid levels are only kept while they have at least this many
+# entries, as reading the finest such level is cheap enough then.
+MIN_LEVEL_CAPACITY = 64
+
+
+class _Level:
+    """A fixed-capacity ring buffer of (time, min, mean, max) entries."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.empty((4, capacity))
+        # Total number of entries ever appended; the next one is written to
+        # index (count % capacity).
+        self.count = 0
+
+    def append(self, t, lo, mean, hi):
+        self.data[:, self.count % self.capacity] = (t, lo, mean, hi)
+        self.count += 1
+
+    def ordered(self):
+        """Returns the stored entries, oldest first."""
+        if self.count <= self.capacity:
+            return self.data[:, :self.count]
+        start = self.count % self.capacity
+        return np.concatenate((self.data[:, start:], self.data[:, :start]),
+                              axis=1)
+
+
+def _reduce(entries):
+    # Combines a (4, n) array of entries into a single one, stamped with the
+    # time of the first.
+    return (entries[0, 0], entries[1].min(), entries[2].mean(),
+            entries[3].max())
+
+
+class StripChartHistory:
+    """
+    The minimum, mean and maximum of the last packets of a stream, along with
+    their arrival times.
+
+    Appending is O(1) (amortized). Besides the per-packet values, a pyramid of
+    coarser levels is maintained, level k combining blocks of 2**k packets, so
+    that get() can return an overview of the whole history while only
+    touching about as many entries as requested.
+    """
+
+    def __init__(self, history_secs=DEFAULT_HISTORY_SECS,
+                 max_packets_per_sec=MAX_PACKETS_PER_SEC):
+        capacity = int(np.ceil(history_secs * max_packets_per_sec))
+        # Round up to a power of two so every level covers the same span.
+        capacity = 1 << max(0, capacity - 1).bit_length()
+
+        self.history_secs = history_secs
+        self._levels = [_Level(capacity)]
+        while capacity // 2 >= MIN_LEVEL_CAPACITY:
+            capacity //= 2
+            self._levels.append(_Level(capacity))
+
+    def __len__(self):
+        return min(self._levels[0].count, self._levels[0].capacity)
+
+    def clear(self):
+        for level in self._levels:
+            level.count = 0
+
+    def append(self, t, samples):
+        """Records the summary of a packet with the given samples."""
+        if not len(samples):
+            return
+        self._levels[0].append(t, np.min(samples), np.mean(samples),
+                               np.max(samples))
+
+        # Whenever a level completes a pair of entries, merge them into the
+        # next one.
+        for finer, coarser in zip(self._levels, self._levels[1:]):
+            if finer.count % 2:
+                break
+            last = (finer.count - 2) % finer.capacity
+            coarser.append(*_reduce(finer.data[:, last:last + 2]))
+
+    def get(self, max_points):
+        """
+        Returns (times, min, mean, max) arrays, oldest first, from the finest
+        level with at most about max_points entries.
+        """
+        raw = self._levels[0]
+        for k, level in enumerate(self._levels):
+            if min(level.count, level.capacity) <= max_points:
+                break
+
+        entries = level.ordered()
+        if k > 0:
+            # The newest packets are not part of a complete block yet; add
+            # them as one more entry so the chart does not lag behind.
+            pending = raw.count % (1 << k)
+            if pending:
+                end = raw.count % raw.capacity or raw.capacity
+                tail = raw.data[:, end - pending:end]
+                entries = np.column_stack((entries, _reduce(tail)))
+        return tuple(entries)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the client against simulated devices (see devil_simulator.py).
+
+Measures stream packet decoding throughput, the latency from a received packet
+to it being painted in the dashboard and control panel plots, the RPC round
+trip time and the time needed to (re)connect to a given number of channels.
+The results are written as JSON, so they can be compared between versions.
+"""
+
+import argparse
+import datetime
+import json
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import zmq
+
+from devil.channel import decode_stream_packet, \
+    decode_multiplexed_stream_packet, stream_topic
+from devil.dashboard import Dashboard, STREAM_IDX_TO_DISPLAY
+from devil.evil2channel import Evil2Channel, STREAM_NAMES
+from devil.guichannel import GuiChannel
+from devil.replaychannel import ReplayChannel
+from devil.streamingview import StreamingView
+from devil_client import VERSION_STRING
+from devil_simulator import Simulator, stream_packet_msg
+import fliquer
+
+from PyQt4 import QtCore as QtC
+from PyQt4 import QtGui as QtG
+from PyQt4 import QtNetwork as QtN
+
+BENCHMARKS = ['decode', 'pixel_latency', 'rpc', 'reconnect']
+
+DEFAULT_POINTS = 2048
+DEFAULT_DECODE_PACKETS = 20000
+DEFAULT_PAINTED_PACKETS = 200
+DEFAULT_RPC_CALLS = 1000
+DEFAULT_RECONNECT_CHANNEL_COUNTS = [1, 10, 50, 100]
+DEFAULT_DASHBOARD_CHANNEL_COUNTS = [1, 16]
+
+# Upper bound for waiting on the simulator, so a broken build fails the run
+# instead of hanging it.
+WAIT_TIMEOUT_SECS = 30
+
+SAMPLE_INTERVAL_SECONDS = 1e-6
+
+
+def _latency_stats(secs):
+    ms = np.asarray(secs) * 1e3
+    return {
+        'count': len(ms),
+        'mean_ms': float(np.mean(ms)),
+        'median_ms': float(np.median(ms)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'max_ms': float(np.max(ms))
+    }
+
+
+def _test_msg(points):
+    t = np.arange(points) / points
+    raw = (100 * np.sin(2 * np.pi * t)).astype(np.int8)
+    return stream_packet_msg(raw, SAMPLE_INTERVAL_SECONDS, points // 4)
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Benchmark:
+    def __init__(self, app, args):
+        self._app = app
+        self._args = args
+        self._zmq_ctx = zmq.Context.instance()
+
+        # Keeps WaitForMoreEvents in _wait_until from blocking indefinitely.
+        self._wakeup_timer = QtC.QTimer()
+        self._wakeup_timer.start(10)
+
+        self.results = []
+
+    def run(self, names):
+        for name in names:
+            print('Running {}...'.format(name), file=sys.stderr)
+            getattr(self, 'bench_' + name)()
+
+    def bench_decode(self):
+        """Packets/s through Channel._got_stream_packet, without any I/O."""
+        with self._simulator(1) as sim:
+            channel = self._connect_channels(sim)[0]
+
+            received = []
+            channel.stream_packet_received.connect(
+                lambda p: received.append(p.samples))
+
+            msg = _test_msg(self._args.points)
+            cases = [
+                ('single', lambda m: decode_stream_packet(0, m), msg),
+                ('multiplexed', decode_multiplexed_stream_packet,
+                 [stream_topic(0), msg])
+            ]
+            for socket_type, decode_fn, m in cases:
+                count = self._args.decode_packets
+                received.clear()
+                start = time.perf_counter()
+                for _ in range(count):
+                    channel._got_stream_packet(decode_fn, m)
+                elapsed = time.perf_counter() - start
+                assert len(received) == count
+
+                self._add_result('decode', {
+                    'socket': socket_type,
+                    'points': self._args.points
+                }, {
+                    'packets_per_sec': count / elapsed,
+                    'samples_per_sec': count * self._args.points / elapsed,
+                    'us_per_packet': elapsed / count * 1e6
+                })
+
+            channel._shutdown()
+
+    def bench_pixel_latency(self):
+        """
+        Time from a decoded packet being handed to the display code until the
+        corresponding widget has been repainted.
+        """
+        msg = _test_msg(self._args.points)
+
+        view = StreamingView(STREAM_NAMES)
+        view.show()
+        self._add_result('pixel_latency', {
+            'view': 'streamingview',
+            'points': self._args.points
+        }, _latency_stats(self._measure_paint(view, view.got_packet, msg)))
+        view.close()
+
+        for count in self._args.dashboard_channels:
+            for sparkline_grid in (True, False):
+                channels = [ReplayChannel('bench {}'.format(i), [])
+                            for i in range(count)]
+                dashboard = Dashboard(VERSION_STRING, sparkline_grid)
+                dashboard.resize(1280, 800)
+                dashboard.add_channels([GuiChannel(c, None)
+                                        for c in channels])
+                dashboard.show()
+
+                # Go through the signal as Dashboard looks up the plot by
+                # sender.
+                emit = channels[0].latest_stream_packet_received.emit
+                self._add_result('pixel_latency', {
+                    'view': 'dashboard',
+                    'sparkline_grid': sparkline_grid,
+                    'channels': count,
+                    'points': self._args.points
+                }, _latency_stats(self._measure_paint(dashboard, emit, msg)))
+                dashboard.close()
+
+    def bench_rpc(self):
+        """Round trip time of sequential pings and pipelined throughput."""
+        with self._simulator(1) as sim:
+            channel = self._connect_channels(sim)[0]
+            count = self._args.rpc_calls
+
+            rtts = []
+            for _ in range(count):
+                done = []
+                start = time.perf_counter()
+                channel._invoke_rpc('ping', [], done.append)
+                self._wait_until(lambda: done)
+                rtts.append(time.perf_counter() - start)
+            self._add_result('rpc', {'mode': 'sequential'},
+                             _latency_stats(rtts))
+
+            done = []
+            start = time.perf_counter()
+            for _ in range(count):
+                channel._invoke_rpc('ping', [], done.append)
+            self._wait_until(lambda: len(done) == count)
+            elapsed = time.perf_counter() - start
+            self._add_result('rpc', {
+                'mode': 'pipelined',
+                'window_size': channel._rpc_window_size
+            }, {'calls_per_sec': count / elapsed})
+
+            channel._shutdown()
+
+    def bench_reconnect(self):
+        """Time until all of a number of channels are ready for use."""
+        for count in self._args.reconnect_channels:
+            with self._simulator(count) as sim:
+                start = time.perf_counter()
+                channels = self._connect_channels(sim)
+                elapsed = time.perf_counter() - start
+                for c in channels:
+                    c._shutdown()
+
+            self._add_result('reconnect', {'channels': count}, {
+                'total_ms': elapsed * 1e3,
+                'ms_per_channel': elapsed / count * 1e3
+            })
+
+    def _measure_paint(self, widget, handle_packet, msg):
+        latencies = []
+        for _ in range(self._args.painted_packets):
+            start = time.perf_counter()
+            handle_packet(decode_stream_packet(STREAM_IDX_TO_DISPLAY, msg))
+            # Deliver the scene change notifications, then paint
+            # synchronously.
+            self._app.processEvents()
+            widget.repaint()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    def _connect_channels(self, sim):
+        host = QtN.QHostAddress('127.0.0.1')
+        ready = []
+        failures = []
+
+        channels = []
+        for d in sim.devices:
+            c = Evil2Channel(self._zmq_ctx, host,
+                             fliquer.resource_from_tuple(*d.resource_tuple()))
+            c.connection_ready.connect(lambda c=c: ready.append(c))
+            c.connection_failed.connect(failures.append)
+            channels.append(c)
+
+        self._wait_until(lambda: len(ready) + len(failures) == len(channels))
+        if failures:
+            raise Exception('Connection to simulator failed: {}'.format(
+                failures[0]))
+        return channels
+
+    def _wait_until(self, predicate):
+        deadline = time.monotonic() + WAIT_TIMEOUT_SECS
+        while not predicate():
+            if time.monotonic() > deadline:
+                raise Exception('Timed out waiting for simulated devices')
+            self._app.processEvents(QtC.QEventLoop.WaitForMoreEvents)
+
+    def _simulator(self, device_count):
+        return _RunningSimulator(Simulator(device_count, packet_rate=0,
+                                           announce_addrs=(),
+                                           zmq_ctx=self._zmq_ctx))
+
+    def _add_result(self, benchmark, params, metrics):
+        self.results.append({
+            'benchmark': benchmark,
+            'params': params,
+            'metrics': metrics
+        })
+
+
+class _RunningSimulator:
+    """Runs a Simulator on a background thread for the duration of a block."""
+
+    def __init__(self, sim):
+        self._sim = sim
+        self._thread = threading.Thread(target=sim.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self._sim
+
+    def __exit__(self, *exc_info):
+        self._sim.stop()
+        self._thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='benchmarks to run, out of {} (default: '
+                             'all)'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('-o', '--output',
+                        help='file to write the JSON results to '
+                             '(default: stdout)')
+    parser.add_argument('--points', type=int, default=DEFAULT_POINTS,
+                        help='samples per stream packet '
+                             '(default: %(default)s)')
+    parser.add_argument('--decode-packets', type=int,
+                        default=DEFAULT_DECODE_PACKETS)
+    parser.add_argument('--painted-packets', type=int,
+                        default=DEFAULT_PAINTED_PACKETS)
+    parser.add_argument('--rpc-calls', type=int, default=DEFAULT_RPC_CALLS)
+    parser.add_argument('--reconnect-channels', type=int, nargs='+',
+                        default=DEFAULT_RECONNECT_CHANNEL_COUNTS)
+    parser.add_argument('--dashboard-channels', type=int, nargs='+',
+                        default=DEFAULT_DASHBOARD_CHANNEL_COUNTS)
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: {}'.format(name))
+
+    output = os.path.abspath(args.output) if args.output else None
+
+    # The views load their .ui files relative to the working directory.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    QtC.QCoreApplication.setApplicationName('DEVIL Benchmark')
+    QtC.QCoreApplication.setOrganizationName('TIQI')
+    QtC.QCoreApplication.setOrganizationDomain('tiqi.ethz.ch')
+    app = QtG.QApplication(sys.argv)
+
+    benchmark = Benchmark(app, args)
+    benchmark.run(args.benchmarks or BENCHMARKS)
+
+    report = {
+        'version': VERSION_STRING,
+        'revision': _git_revision(),
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'qt': QtC.QT_VERSION_STR,
+        'results': benchmark.results
+    }
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -3,6 +3,7 @@
 from devil.evil2channel import Evil2Channel, create_evil2_control_panel
 from devil.devicelist import DeviceList
 import fliquer
+import qtzmq
 import zmq
 
 from PyQt4 import QtCore as QtC
@@ -10,6 +11,14 @@ from PyQt4 import QtGui as QtG
 
 VERSION_STRING = '1.0.1'
 
+# Receive and decode stream packets on a background thread to keep the GUI
+# thread free for rendering.
+USE_STREAM_IO_THREAD = True
+
+# Receive all streams of a device over a single socket if it supports that.
+# Costs an additional round trip on connect.
+USE_MULTIPLEXED_STREAMS = False
+
 if __name__ == '__main__':
     import sys
 
@@ -37,6 +46,11 @@ if __name__ == '__main__':
 
     zmq_ctx = zmq.Context()
 
+    stream_receiver = None
+    if USE_STREAM_IO_THREAD:
+        stream_receiver = qtzmq.ReceiverThread(zmq_ctx)
+        app.aboutToQuit.connect(stream_receiver.close)
+
     device_list = DeviceList(VERSION_STRING)
     device_list.closed.connect(app.quit)
 
@@ -50,7 +64,9 @@ if __name__ == '__main__':
             return
 
         if resource.version.major == 2:
-            device_list.register(Evil2Channel(zmq_ctx, host, resource),
+            device_list.register(Evil2Channel(
+                zmq_ctx, host, resource, stream_receiver=stream_receiver,
+                multiplex_streams=USE_MULTIPLEXED_STREAMS),
                 lambda *args: create_evil2_control_panel(VERSION_STRING, *args))
         else:
             QtC.qWarning('Cannot handle EVIL version {}, ignoring'.format(
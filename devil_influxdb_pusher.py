@@ -8,10 +8,15 @@ from the GUI client.
 """
 
 from devil.evil2channel import Evil2Channel
+import collections
 import fliquer
 import influxdb
+import json
 import msgpack
 import numpy as np
+import os
+import threading
+import time
 import zmq
 from PyQt4 import QtCore as QtC
 
@@ -19,10 +24,368 @@ STREAMS_TO_LOG = {0: 'in_error', 1: 'out_control'}
 
 SAMPLE_WINDOW_SIZE = 2**16
 
+# Resolution of the stream samples; see channel.StreamPacket.
+SAMPLE_BITS = 10
+
+# Percentiles to log in addition to min/mean/max, by field name.
+WINDOW_PERCENTILES = {'p20': 20, 'p80': 80}
+
+# Points are written to the database in batches of this size, or whatever has
+# accumulated after the flush interval, whichever comes first.
+WRITE_BATCH_SIZE = 500
+WRITE_FLUSH_INTERVAL_SECS = 10
+
+# Upper bound for the number of points waiting to be written. If the database
+# cannot keep up, the oldest points are dropped.
+MAX_QUEUED_POINTS = 100000
+
+STATS_LOG_INTERVAL_MSECS = 60 * 1000
+
+# While the database is unreachable, points are spilled to an on-disk journal
+# made up of segments of about SPILL_SEGMENT_BYTES each. If the journal grows
+# beyond SPILL_MAX_BYTES, the oldest segments are discarded.
+SPILL_DIR = os.path.expanduser('~/.devil_influxdb_pusher/spill')
+SPILL_SEGMENT_BYTES = 16 * 2**20
+SPILL_MAX_BYTES = 1024 * 2**20
+
+# Once the database is back, spilled points are replayed in batches of this
+# size, at most one batch per interval to leave room for live points.
+REPLAY_BATCH_SIZE = 5000
+REPLAY_INTERVAL_SECS = 1
+
+
+class SampleHistogram:
+    """
+    Histogram of integer samples covering the full hardware range.
+
+    All statistics are derived from the bin counts, so updating it is a single
+    linear pass over the new samples and no sample data needs to be kept
+    around. Any number of percentiles can be computed from one cumulative sum.
+    """
+
+    def __init__(self, sample_bits=SAMPLE_BITS):
+        self._offset = 2 ** (sample_bits - 1)
+        self._values = np.arange(-self._offset, self._offset)
+        self._counts = np.zeros(2 ** sample_bits, np.int64)
+        self.count = 0
+
+    def add(self, samples):
+        self._counts += np.bincount(samples + self._offset,
+                                    minlength=len(self._counts))
+        self.count += len(samples)
+
+    def clear(self):
+        self._counts[:] = 0
+        self.count = 0
+
+    def min(self):
+        return self._values[np.flatnonzero(self._counts)[0]]
+
+    def max(self):
+        return self._values[np.flatnonzero(self._counts)[-1]]
+
+    def mean(self):
+        return np.dot(self._counts, self._values) / self.count
+
+    def rms(self):
+        return np.sqrt(np.dot(self._counts, self._values ** 2) / self.count)
+
+    def percentiles(self, qs):
+        """
+        Returns the given percentiles, interpolated linearly between the
+        closest ranks like np.percentile does by default.
+        """
+        cum_counts = np.cumsum(self._counts)
+        pos = np.asarray(qs, dtype=np.float64) / 100 * (self.count - 1)
+        lo = np.floor(pos)
+        lo_vals = self._values[np.searchsorted(cum_counts, lo, side='right')]
+        hi_vals = self._values[np.searchsorted(cum_counts, np.ceil(pos),
+                                               side='right')]
+        return lo_vals + (hi_vals - lo_vals) * (pos - lo)
+
+
+class WindowAccumulator:
+    """
+    Collects samples into consecutive fixed-size windows, accumulating the
+    statistics of each window incrementally in a SampleHistogram.
+
+    on_full is called with the histogram every time a window has been
+    completed. It is reset by the next call to append(), so it must not be
+    kept around.
+    """
+
+    def __init__(self, size, on_full):
+        self._size = size
+        self._histogram = SampleHistogram()
+        self._on_full = on_full
+
+    def append(self, samples):
+        while len(samples):
+            n = min(len(samples), self._size - self._histogram.count)
+            self._histogram.add(samples[:n])
+            samples = samples[n:]
+
+            if self._histogram.count == self._size:
+                self._on_full(self._histogram)
+                self._histogram.clear()
+
+
+class SpillJournal:
+    """
+    Append-only on-disk journal of InfluxDB points, split into numbered
+    segment files of JSON lines.
+
+    Replay progress within the oldest segment is only tracked in memory, so
+    after a restart some points might be written twice. This is harmless, as
+    InfluxDB overwrites points with the same series and timestamp.
+    """
+
+    SEGMENT_NAME_FORMAT = 'segment-{:010d}.jsonl'
+
+    def __init__(self, directory, segment_bytes=SPILL_SEGMENT_BYTES,
+                 max_bytes=SPILL_MAX_BYTES):
+        self.dropped_points = 0
+
+        self._directory = directory
+        self._segment_bytes = segment_bytes
+        self._max_bytes = max_bytes
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = sorted(int(n.split('-')[1].split('.')[0])
+                                for n in os.listdir(directory)
+                                if n.startswith('segment-'))
+        self._write_file = None
+        self._read_offset = 0
+
+    def is_empty(self):
+        return not self._segments
+
+    def total_bytes(self):
+        return sum(os.path.getsize(self._path(s)) for s in self._segments)
+
+    def append(self, points):
+        if self._write_file is None:
+            self._start_segment()
+
+        for p in points:
+            self._write_file.write(json.dumps(p, separators=(',', ':')))
+            self._write_file.write('\n')
+        self._write_file.flush()
+
+        if self._write_file.tell() >= self._segment_bytes:
+            self._finish_segment()
+
+        while len(self._segments) > 1 and self.total_bytes() > self._max_bytes:
+            self._discard_oldest_segment()
+
+    def read_batch(self, max_points):
+        """
+        Returns up to max_points of the oldest points in the journal. They
+        are only removed from the journal once consume() is called.
+        """
+        if self._write_file and self._segments[0] == self._segments[-1]:
+            # Do not read from the segment we are still appending to.
+            self._finish_segment()
+
+        points = []
+        with open(self._path(self._segments[0]), 'r') as f:
+            f.seek(self._read_offset)
+            while len(points) < max_points:
+                line = f.readline()
+                if not line:
+                    break
+                if line.endswith('\n'):
+                    points.append(json.loads(line))
+            self._pending_read_offset = f.tell()
+        return points
+
+    def consume(self):
+        """Removes the points returned by the last read_batch() call."""
+        self._read_offset = self._pending_read_offset
+        path = self._path(self._segments[0])
+        if self._read_offset >= os.path.getsize(path):
+            os.remove(path)
+            self._segments.pop(0)
+            self._read_offset = 0
+
+    def close(self):
+        if self._write_file:
+            self._finish_segment()
+
+    def _path(self, segment):
+        return os.path.join(self._directory,
+                            self.SEGMENT_NAME_FORMAT.format(segment))
+
+    def _start_segment(self):
+        segment = self._segments[-1] + 1 if self._segments else 0
+        self._segments.append(segment)
+        self._write_file = open(self._path(segment), 'w')
+
+    def _finish_segment(self):
+        self._write_file.close()
+        self._write_file = None
+
+    def _discard_oldest_segment(self):
+        path = self._path(self._segments.pop(0))
+        with open(path, 'rb') as f:
+            # Points before the read offset have already been replayed.
+            f.seek(self._read_offset)
+            lines = sum(chunk.count(b'\n') for chunk in iter(
+                lambda: f.read(2**20), b''))
+        os.remove(path)
+        self.dropped_points += lines
+        self._read_offset = 0
+        QtC.qWarning(' :: Spill journal full, discarded {} points'.format(
+            lines))
+
+
+class PointWriter:
+    """
+    Write-behind queue for InfluxDB points.
+
+    Points from all channels are collected and written in batches from a
+    worker thread, so a slow database never blocks the Qt event loop. The
+    queue is bounded; see the counters for points that had to be dropped.
+
+    If a SpillJournal is given, batches that cannot be written are spilled to
+    it instead of being dropped, and replayed (rate-limited) once writing
+    succeeds again.
+    """
+
+    def __init__(self, db, batch_size=WRITE_BATCH_SIZE,
+                 flush_interval_secs=WRITE_FLUSH_INTERVAL_SECS,
+                 max_queued_points=MAX_QUEUED_POINTS, journal=None,
+                 replay_batch_size=REPLAY_BATCH_SIZE,
+                 replay_interval_secs=REPLAY_INTERVAL_SECS):
+        self.written_points = 0
+        self.dropped_points = 0
+        self.failed_writes = 0
+        self.spilled_points = 0
+        self.replayed_points = 0
 
-class Pusher:
-    def __init__(self, db, channel, on_disconnect):
         self._db = db
+        self._journal = journal
+        self._db_reachable = True
+        self._replay_batch_size = replay_batch_size
+        self._replay_interval_secs = replay_interval_secs
+        self._batch_size = batch_size
+        self._flush_interval_secs = flush_interval_secs
+
+        self._points = collections.deque(maxlen=max_queued_points)
+        self._cond = threading.Condition()
+        self._stopping = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, point):
+        with self._cond:
+            if len(self._points) == self._points.maxlen:
+                self.dropped_points += 1
+            self._points.append(point)
+            if len(self._points) >= self._batch_size:
+                self._cond.notify()
+
+    def queued_points(self):
+        with self._cond:
+            return len(self._points)
+
+    def close(self):
+        """Writes out all queued points and stops the worker thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        deadline = time.monotonic() + self._flush_interval_secs
+        next_replay = time.monotonic()
+        while True:
+            timeout = deadline - time.monotonic()
+            if self._should_replay():
+                timeout = min(timeout, next_replay - time.monotonic())
+
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: (self._stopping or
+                             len(self._points) >= self._batch_size),
+                    max(0, timeout))
+
+                if self._stopping and not self._points:
+                    if self._journal:
+                        self._journal.close()
+                    return
+
+                n = min(len(self._points), self._batch_size)
+                batch = [self._points.popleft() for _ in range(n)]
+
+            if len(batch) < self._batch_size:
+                # Queue drained, wait for a full batch or the next deadline.
+                deadline = time.monotonic() + self._flush_interval_secs
+
+            if batch:
+                self._write_batch(batch)
+
+            if (self._should_replay() and not self._stopping and
+                    time.monotonic() >= next_replay):
+                self._replay_batch()
+                next_replay = time.monotonic() + self._replay_interval_secs
+
+    def _should_replay(self):
+        return (self._journal is not None and self._db_reachable and
+                not self._journal.is_empty())
+
+    def _write_batch(self, batch):
+        try:
+            self._db.write_points(batch, time_precision='ms')
+            self.written_points += len(batch)
+            self._db_reachable = True
+        except Exception as e:
+            self.failed_writes += 1
+            if self._db_reachable:
+                QtC.qWarning(' :: Writing {} points failed: {}'.format(
+                    len(batch), e))
+            self._db_reachable = False
+
+            if self._journal:
+                self._journal.append(batch)
+                self.spilled_points += len(batch)
+            else:
+                # Also updated by write() on the GUI thread.
+                with self._cond:
+                    self.dropped_points += len(batch)
+
+    def _replay_batch(self):
+        batch = self._journal.read_batch(self._replay_batch_size)
+        if not batch:
+            self._journal.consume()
+            return
+
+        try:
+            self._db.write_points(batch, time_precision='ms')
+        except Exception as e:
+            self.failed_writes += 1
+            self._db_reachable = False
+            QtC.qWarning(' :: Replaying {} spilled points failed: {}'.format(
+                len(batch), e))
+            return
+        self._journal.consume()
+        self.replayed_points += len(batch)
+
+    def stats_string(self):
+        res = ('{} points written, {} queued, {} dropped, {} failed '
+               'writes').format(self.written_points, self.queued_points(),
+                                self.dropped_points, self.failed_writes)
+        if self._journal:
+            res += ', {} spilled, {} replayed, {} discarded from journal'.format(
+                self.spilled_points, self.replayed_points,
+                self._journal.dropped_points)
+        return res
+
+
+class Pusher:
+    def __init__(self, writer, channel, on_disconnect):
+        self._writer = writer
 
         self._channel = channel
         channel.connection_ready.connect(self._setup_streams)
@@ -30,9 +393,11 @@ class Pusher:
         channel.connection_failed.connect(self._channel_failed)
         channel.shutting_down.connect(self._channel_shutdown)
 
-        self._stream_bufs = {}
+        self._stream_windows = {}
         for k in STREAMS_TO_LOG:
-            self._stream_bufs[k] = np.array([], dtype=np.int16)
+            self._stream_windows[k] = WindowAccumulator(
+                SAMPLE_WINDOW_SIZE,
+                lambda hist, idx=k: self._push_window(idx, hist))
 
         self._on_disconnect = on_disconnect
 
@@ -44,32 +409,29 @@ class Pusher:
         idx = packet.stream_idx
         if not idx in STREAMS_TO_LOG:
             return
-        self._stream_bufs[idx] = np.append(self._stream_bufs[idx], packet.samples)
-        self._push_stream_buf_if_full(idx)
-
-    def _push_stream_buf_if_full(self, idx):
-        buf = self._stream_bufs[idx]
-        if np.size(buf) < SAMPLE_WINDOW_SIZE:
-            return
-
-        data = buf[:SAMPLE_WINDOW_SIZE]
-
-        self._db.write_points([{
+        self._stream_windows[idx].append(packet.samples)
+
+    def _push_window(self, idx, hist):
+        fields = {
+            'min': int(hist.min()),
+            'mean': hist.mean(),
+            'max': int(hist.max())
+        }
+        percentiles = hist.percentiles(list(WINDOW_PERCENTILES.values()))
+        for name, value in zip(WINDOW_PERCENTILES.keys(), percentiles):
+            fields[name] = value
+
+        self._writer.write({
             'measurement': STREAMS_TO_LOG[idx],
+            # Explicitly timestamp the points, as they might only be written
+            # much later (see PointWriter).
+            'time': int(time.time() * 1000),
             'tags': {
                 'dev_id': self._channel.resource.dev_id,
                 'display_name': self._channel.resource.display_name
             },
-            'fields': {
-                'min': np.min(data),
-                'p20': np.percentile(data, 20),
-                'mean': np.mean(data),
-                'p80': np.percentile(data, 80),
-                'max': np.max(data)
-            }
-        }])
-
-        self._stream_bufs[idx] = buf[SAMPLE_WINDOW_SIZE:]
+            'fields': fields
+        })
 
     def _channel_failed(self, msg):
         QtC.qWarning(' :: Channel "{}" failed: {}'.format(
@@ -97,13 +459,22 @@ if __name__ == '__main__':
     DB_HOST = 'hydrogen.ethz.ch'
     DB_PORT = 8086
     DB_DATABASE = 'tiqi'
+    DB_TIMEOUT_SECS = 10
     DB_USER = fetch_from_env('DEVIL_INFLUXDB_USER', 'InfluxDB user name')
     DB_PASSWORD = fetch_from_env('DEVIL_INFLUXDB_PASSWORD',
                                  'InfluxDB password')
 
     app = QtC.QCoreApplication(sys.argv)
     db = influxdb.InfluxDBClient(DB_HOST, DB_PORT, DB_USER, DB_PASSWORD,
-                                 DB_DATABASE)
+                                 DB_DATABASE, timeout=DB_TIMEOUT_SECS)
+
+    writer = PointWriter(db, journal=SpillJournal(SPILL_DIR))
+    app.aboutToQuit.connect(writer.close)
+
+    stats_timer = QtC.QTimer()
+    stats_timer.timeout.connect(
+        lambda: QtC.qDebug(' :: ' + writer.stats_string()))
+    stats_timer.start(STATS_LOG_INTERVAL_MSECS)
     zmq_ctx = zmq.Context()
     node = fliquer.Node()
     channels_for_dev_ids = {}
@@ -131,8 +502,8 @@ if __name__ == '__main__':
             channels_for_dev_ids.pop(nid)
             node.broadcast_enumeration_request()
 
-        channels_for_dev_ids[nid] = Pusher(db, Evil2Channel(zmq_ctx, host,
-                                                            resource),
+        channels_for_dev_ids[nid] = Pusher(writer, Evil2Channel(zmq_ctx, host,
+                                                                resource),
                                            on_disconnect)
 
     node.new_remote_resource.connect(new_resource)
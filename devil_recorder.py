@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+"""
+Records the raw stream packets of DEVIL channels to disk.
+
+Every packet of the selected streams is appended to a chunked archive per
+device (see devil.streamarchive), for example to be able to analyze lock
+losses after the fact.
+"""
+
+from devil.evil2channel import Evil2Channel
+from devil.streamarchive import ArchiveWriter, DEFAULT_CHUNK_SECS
+import argparse
+import fliquer
+import os
+import zmq
+from PyQt4 import QtCore as QtC
+
+FLUSH_INTERVAL_MSECS = 1000
+
+
+class Recorder:
+    def __init__(self, channel, streams, writer, on_disconnect):
+        self._channel = channel
+        self._streams = streams
+        self._writer = writer
+
+        channel.connection_ready.connect(self._setup_streams)
+        channel.stream_packet_received.connect(self._got_stream_packet)
+        channel.connection_failed.connect(self._channel_failed)
+        channel.shutting_down.connect(self._channel_shutdown)
+
+        self._on_disconnect = on_disconnect
+
+    def _setup_streams(self):
+        for k in self._streams:
+            self._channel.add_stream_subscription(k)
+
+    def _got_stream_packet(self, packet):
+        if packet.stream_idx in self._streams:
+            self._writer.write(packet)
+
+    def _channel_failed(self, msg):
+        QtC.qWarning(' :: Channel "{}" failed: {}'.format(
+            self._channel.resource.display_name, msg))
+        self._on_disconnect()
+
+    def _channel_shutdown(self):
+        QtC.qWarning(' :: Channel "{}" shutting down'.format(
+            self._channel.resource.display_name))
+        self._on_disconnect()
+
+
+if __name__ == '__main__':
+    import sys
+
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('output_dir',
+                        help='directory to create the per-device archives in')
+    parser.add_argument('-d', '--device', action='append', dest='devices',
+                        metavar='DEVICE',
+                        help='device id or display name to record (default: '
+                             'all; can be given multiple times)')
+    parser.add_argument('-s', '--streams', default='0',
+                        help='comma-separated stream indices to record '
+                             '(default: %(default)s)')
+    parser.add_argument('--chunk-secs', type=float, default=DEFAULT_CHUNK_SECS,
+                        help='start a new chunk after this many seconds '
+                             '(default: %(default)s)')
+    parser.add_argument('--max-chunks', type=int, default=None,
+                        help='delete the oldest chunks of each device to keep '
+                             'at most this many')
+    parser.add_argument('--compress', action='store_true',
+                        help='compress finished chunks (they can then no '
+                             'longer be memory-mapped)')
+    args = parser.parse_args()
+
+    streams = set(int(s) for s in args.streams.split(','))
+
+    app = QtC.QCoreApplication(sys.argv)
+    zmq_ctx = zmq.Context()
+    node = fliquer.Node()
+    recorders_for_dev_ids = {}
+
+    # Keep archives open across reconnects.
+    writers_for_dev_ids = {}
+
+    def close_writers():
+        for w in writers_for_dev_ids.values():
+            w.close()
+    app.aboutToQuit.connect(close_writers)
+
+    flush_timer = QtC.QTimer()
+    flush_timer.timeout.connect(
+        lambda: [w.flush() for w in writers_for_dev_ids.values()])
+    flush_timer.start(FLUSH_INTERVAL_MSECS)
+
+    def new_resource(host, resource):
+        if resource.dev_type != 'tiqi.devil.channel':
+            return
+
+        nid = resource.dev_id
+        if args.devices and not (nid in args.devices or
+                                 resource.display_name in args.devices):
+            return
+
+        if nid in recorders_for_dev_ids:
+            return
+
+        QtC.qDebug(' :: Discovered new channel: {}'.format(resource))
+
+        if resource.version.major != 2:
+            QtC.qWarning(' :: Ignoring EVIL version {} @ {} ({})'.format(
+                resource.version, host, resource.display_name))
+            return
+
+        def on_disconnect():
+            # A failed channel also shuts down, so this is called twice when
+            # the connection is lost.
+            if recorders_for_dev_ids.pop(nid, None):
+                node.broadcast_enumeration_request()
+
+        writer = writers_for_dev_ids.get(nid)
+        if not writer:
+            writer = ArchiveWriter(os.path.join(args.output_dir, nid),
+                                   resource, chunk_secs=args.chunk_secs,
+                                   max_chunks=args.max_chunks,
+                                   compress=args.compress)
+            writers_for_dev_ids[nid] = writer
+
+        recorders_for_dev_ids[nid] = Recorder(
+            Evil2Channel(zmq_ctx, host, resource), streams, writer,
+            on_disconnect)
+
+    node.new_remote_resource.connect(new_resource)
+
+    sys.exit(app.exec_())
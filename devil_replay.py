@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Runs the DEVIL client GUI against replayed stream data instead of devices.
+
+Each source is either a stream snapshot file (.evl), a single array saved with
+np.save (.npy), or a per-device archive directory written by
+devil_recorder.py.
+"""
+
+from devil.devicelist import DeviceList
+from devil.replaychannel import ReplayChannel, create_replay_control_panel, \
+    packets_from_archive, packets_from_arrays, packets_from_evl
+import argparse
+import numpy as np
+import os
+
+from PyQt4 import QtCore as QtC
+from PyQt4 import QtGui as QtG
+
+VERSION_STRING = '1.0.1 (replay)'
+
+
+def load_packets(source, sample_interval_seconds):
+    if os.path.isdir(source):
+        return list(packets_from_archive(source))
+    if source.endswith('.npy'):
+        return list(packets_from_arrays(
+            [np.load(source, mmap_mode='r')],
+            sample_interval_seconds=sample_interval_seconds))
+    return list(packets_from_evl(
+        source, sample_interval_seconds=sample_interval_seconds))
+
+
+if __name__ == '__main__':
+    import sys
+
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('sources', nargs='+', metavar='SOURCE',
+                        help='.evl/.npy file or recorder archive directory')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='playback speed factor, 0 for as fast as '
+                             'possible (default: %(default)s)')
+    parser.add_argument('--copies', type=int, default=1,
+                        help='number of channels to create per source '
+                             '(default: %(default)s)')
+    parser.add_argument('--loop', action='store_true',
+                        help='restart from the beginning when done')
+    parser.add_argument('--sample-interval', type=float, default=1e-6,
+                        help='sample interval for sources without timing '
+                             'information, in seconds (default: %(default)s)')
+    args = parser.parse_args()
+
+    QtC.QCoreApplication.setApplicationName('DEVIL replay')
+    QtC.QCoreApplication.setOrganizationName('TIQI')
+    QtC.QCoreApplication.setOrganizationDomain('tiqi.ethz.ch')
+
+    app = QtG.QApplication(sys.argv)
+
+    device_list = DeviceList(VERSION_STRING)
+    device_list.closed.connect(app.quit)
+
+    channels = []
+    for source in args.sources:
+        packets = load_packets(source, args.sample_interval)
+        name = os.path.basename(os.path.normpath(source))
+        for i in range(args.copies):
+            c = ReplayChannel('{} #{}'.format(name, i) if args.copies > 1
+                              else name, packets, speed=args.speed or None,
+                              loop=args.loop)
+            device_list.register(
+                c, lambda *a: create_replay_control_panel(VERSION_STRING, *a))
+            channels.append(c)
+
+    for c in channels:
+        c.start()
+
+    device_list.show()
+    sys.exit(app.exec_())
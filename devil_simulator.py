@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+"""
+Simulates EVIL devices for testing and load-testing the client without
+hardware.
+
+Each simulated device is announced via the fliquer resource discovery
+protocol and serves the same msgpack-rpc interface over zmq as the real
+firmware, publishing synthetic stream packets at a configurable rate.
+"""
+
+import argparse
+import msgpack
+import numpy as np
+import socket
+import time
+import zlib
+import zmq
+
+MSGPACKRPC_REQUEST = 0
+MSGPACKRPC_RESPONSE = 1
+MSGPACKRPC_NOTIFICATION = 2
+
+MSGPACK_EXT_INT8ARRAY = 1
+
+FLIQUER_PORT = 8474
+DEV_TYPE = 'tiqi.devil.channel'
+DEV_VERSION = (2, 0, 0, 'sim', '')
+
+ANNOUNCE_INTERVAL_SECS = 5
+
+# Clients connect to the address the announcement datagram came from, which
+# for a broadcast is that of the outgoing interface, not loopback. Thus,
+# listen on all interfaces by default.
+DEFAULT_BIND_HOST = '*'
+DEFAULT_ANNOUNCE_ADDRS = ('255.255.255.255',)
+
+STREAM_COUNT = 4
+REGISTER_COUNT = 31
+
+# Number of different packets precomputed per stream; they are published in
+# turn so the simulator spends almost no time packing data.
+FRAMES_PER_STREAM = 16
+
+DEFAULT_TIME_SPAN_SECONDS = 0.01
+DEFAULT_POINTS = 2048
+DEFAULT_PACKET_RATE = 20
+
+# Keep in sync with devil.channel.
+STREAM_TOPIC_FORMAT = 'stream/{}/'
+
+
+def stream_packet_msg(raw_samples, sample_interval_seconds, trigger_offset):
+    """
+    Packs a streamPacket notification as sent by the firmware, given the
+    samples as int8 array.
+    """
+    return msgpack.packb((
+        MSGPACKRPC_NOTIFICATION, 'streamPacket', [{
+            'sampleIntervalSeconds': sample_interval_seconds,
+            'triggerOffset': trigger_offset,
+            'samples': msgpack.ExtType(MSGPACK_EXT_INT8ARRAY,
+                                       raw_samples.tobytes())
+        }]))
+
+
+class SimulatedDevice:
+    def __init__(self, zmq_ctx, dev_id, display_name, bind_host,
+                 multiplexed_streams=True, bulk_register_read=True):
+        self.dev_id = dev_id
+        self.display_name = display_name
+
+        self._multiplexed_streams = multiplexed_streams
+        self._bulk_register_read = bulk_register_read
+
+        self._registers = [0] * REGISTER_COUNT
+        self._time_span_seconds = DEFAULT_TIME_SPAN_SECONDS
+        self._points = DEFAULT_POINTS
+        self._frame_idx = 0
+
+        def bind(sock_type):
+            s = zmq_ctx.socket(sock_type)
+            port = s.bind_to_random_port('tcp://' + bind_host)
+            return s, port
+
+        self.rpc_socket, self.port = bind(zmq.ROUTER)
+        self._notification_socket, self._notification_port = bind(zmq.PUB)
+        streams = [bind(zmq.PUB) for _ in range(STREAM_COUNT)]
+        self._stream_sockets = [s for s, _ in streams]
+        self._stream_ports = [p for _, p in streams]
+        self._multiplexed_socket, self._multiplexed_port = bind(zmq.PUB)
+
+        self._generate_frames()
+
+    def resource_tuple(self):
+        return (DEV_TYPE, self.dev_id, self.display_name, DEV_VERSION,
+                self.port)
+
+    def handle_rpc(self):
+        while True:
+            try:
+                frames = self.rpc_socket.recv_multipart(flags=zmq.NOBLOCK)
+            except zmq.Again:
+                return
+
+            # [identity, (empty delimiter,) request]
+            envelope, request = frames[:-1], frames[-1]
+            msg_type, seq_id, method, params = msgpack.unpackb(
+                request, encoding='utf-8')
+            if msg_type != MSGPACKRPC_REQUEST:
+                continue
+
+            try:
+                err, result = None, self._call(method, params)
+            except Exception as e:
+                err, result = '{}: {}'.format(type(e).__name__, e), None
+
+            response = msgpack.packb((MSGPACKRPC_RESPONSE, seq_id, err, result))
+            self.rpc_socket.send_multipart(envelope + [response])
+
+    def publish_packets(self):
+        for idx, s in enumerate(self._stream_sockets):
+            msg = self._frames[idx][self._frame_idx]
+            s.send(msg)
+            if self._multiplexed_streams:
+                self._multiplexed_socket.send_multipart(
+                    [STREAM_TOPIC_FORMAT.format(idx).encode(), msg])
+        self._frame_idx = (self._frame_idx + 1) % FRAMES_PER_STREAM
+
+    def shutdown(self):
+        self._notify('shutdown', [])
+
+    def close(self):
+        for s in [self.rpc_socket, self._notification_socket,
+                  self._multiplexed_socket] + self._stream_sockets:
+            s.close(linger=0)
+
+    def _call(self, method, params):
+        if method == 'ping':
+            return True
+        if method == 'notificationPort':
+            return self._notification_port
+        if method == 'streamPorts':
+            return self._stream_ports
+        if method == 'multiplexedStreamPort' and self._multiplexed_streams:
+            return self._multiplexed_port
+        if method == 'readRegister':
+            return self._registers[params[0]]
+        if method == 'readRegisters' and self._bulk_register_read:
+            return [self._registers[i] for i in params[0]]
+        if method == 'modifyRegister':
+            idx, old_val, new_val = params
+            if self._registers[idx] != old_val:
+                return False
+            self._registers[idx] = new_val
+            self._notify('registerChanged', [idx, new_val])
+            return True
+        if method == 'streamAcquisitionConfig':
+            return [self._time_span_seconds, self._points]
+        if method == 'setStreamAcquisitionConfig':
+            self._time_span_seconds, self._points = params
+            self._generate_frames()
+            self._notify('streamAcquisitionConfigChanged',
+                         [self._time_span_seconds, self._points])
+            return None
+        raise Exception('Unknown method: {}'.format(method))
+
+    def _notify(self, method, params):
+        self._notification_socket.send(
+            msgpack.packb((MSGPACKRPC_NOTIFICATION, method, params)))
+
+    def _generate_frames(self):
+        interval = self._time_span_seconds / self._points
+        t = np.arange(self._points) / self._points
+        # Unlike hash(), the CRC does not change between interpreter runs, so
+        # the data is the same for every benchmark run.
+        rng = np.random.RandomState(zlib.crc32(self.dev_id.encode()))
+
+        self._frames = []
+        for idx in range(STREAM_COUNT):
+            frames = []
+            for i in range(FRAMES_PER_STREAM):
+                phase = 2 * np.pi * i / FRAMES_PER_STREAM
+                samples = (100 * np.sin(2 * np.pi * (idx + 1) * t + phase) +
+                           rng.normal(0, 5, self._points))
+                frames.append(stream_packet_msg(
+                    np.clip(samples, -128, 127).astype(np.int8), interval,
+                    self._points // 4))
+            self._frames.append(frames)
+
+
+class Simulator:
+    """
+    Runs a number of simulated devices in a single-threaded event loop.
+
+    If announce_addrs is empty, devices are not announced via fliquer; the
+    caller can then connect to them directly using resource_tuple().
+
+    If bind_host is a loopback address, the devices can only be reached by
+    clients that receive the announcement via loopback, so all of
+    announce_addrs must be loopback addresses as well.
+    """
+
+    def __init__(self, device_count, packet_rate=DEFAULT_PACKET_RATE,
+                 bind_host=DEFAULT_BIND_HOST,
+                 announce_addrs=DEFAULT_ANNOUNCE_ADDRS, name_prefix='sim',
+                 zmq_ctx=None, **device_kwargs):
+        if _is_loopback(bind_host):
+            remote = [a for a in announce_addrs if not _is_loopback(a)]
+            if remote:
+                raise ValueError(
+                    'Devices bound to loopback address {} would not be '
+                    'reachable by clients receiving the announcement to '
+                    '{}'.format(bind_host, ', '.join(remote)))
+
+        self._zmq_ctx = zmq_ctx or zmq.Context.instance()
+        self._packet_interval = 1 / packet_rate if packet_rate else None
+        self._announce_addrs = announce_addrs
+
+        self.devices = [SimulatedDevice(
+            self._zmq_ctx, '{}-{:04d}'.format(name_prefix, i),
+            '{} {}'.format(name_prefix, i), bind_host, **device_kwargs)
+            for i in range(device_count)]
+
+        self._udp_socket = None
+        if announce_addrs:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            s.bind(('0.0.0.0', FLIQUER_PORT))
+            s.setblocking(False)
+            self._udp_socket = s
+
+        self._stopping = False
+
+    def stop(self):
+        """Can be called from another thread to make run() return."""
+        self._stopping = True
+
+    def run(self):
+        poller = zmq.Poller()
+        rpc_sockets = {}
+        for d in self.devices:
+            poller.register(d.rpc_socket, zmq.POLLIN)
+            rpc_sockets[d.rpc_socket] = d
+        if self._udp_socket:
+            poller.register(self._udp_socket, zmq.POLLIN)
+
+        now = time.monotonic()
+        next_packet = now
+        next_announce = now
+
+        while not self._stopping:
+            now = time.monotonic()
+            if self._udp_socket and now >= next_announce:
+                self._announce()
+                next_announce = now + ANNOUNCE_INTERVAL_SECS
+            if self._packet_interval and now >= next_packet:
+                for d in self.devices:
+                    d.publish_packets()
+                # Do not try to catch up if we fell behind.
+                next_packet = max(next_packet + self._packet_interval, now)
+
+            deadlines = [next_announce] if self._udp_socket else []
+            if self._packet_interval:
+                deadlines.append(next_packet)
+            timeout = 100
+            if deadlines:
+                timeout = min(timeout, max(0, min(deadlines) - now) * 1000)
+
+            for sock, _ in poller.poll(timeout):
+                if sock is self._udp_socket:
+                    self._handle_udp()
+                else:
+                    rpc_sockets[sock].handle_rpc()
+
+        for d in self.devices:
+            d.shutdown()
+            d.close()
+        if self._udp_socket:
+            self._udp_socket.close()
+
+    def _handle_udp(self):
+        while True:
+            try:
+                data, _ = self._udp_socket.recvfrom(65536)
+            except BlockingIOError:
+                return
+            try:
+                msg_type, method, _ = msgpack.unpackb(data, encoding='utf-8')
+            except Exception:
+                continue
+            if msg_type == MSGPACKRPC_NOTIFICATION and method == 'enumerate':
+                self._announce()
+
+    def _announce(self):
+        # Keep the datagrams small by announcing a few devices at a time.
+        for i in range(0, len(self.devices), 16):
+            msg = msgpack.packb((MSGPACKRPC_NOTIFICATION, 'resources',
+                                 [d.resource_tuple()
+                                  for d in self.devices[i:i + 16]]))
+            for addr in self._announce_addrs:
+                try:
+                    self._udp_socket.sendto(msg, (addr, FLIQUER_PORT))
+                except OSError as e:
+                    print('Could not announce to {}: {}'.format(addr, e))
+
+
+def _is_loopback(host):
+    return host == 'localhost' or host.startswith('127.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--devices', type=int, default=1,
+                        help='number of devices to simulate '
+                             '(default: %(default)s)')
+    parser.add_argument('-r', '--rate', type=float, default=DEFAULT_PACKET_RATE,
+                        help='stream packets per second and stream '
+                             '(default: %(default)s)')
+    parser.add_argument('--bind', default=DEFAULT_BIND_HOST,
+                        help='address to serve the zmq sockets on '
+                             '(default: all interfaces)')
+    parser.add_argument('--announce', action='append', dest='announce_addrs',
+                        metavar='ADDR',
+                        help='broadcast address to announce the devices to '
+                             '(default: {}; can be given multiple '
+                             'times)'.format(', '.join(DEFAULT_ANNOUNCE_ADDRS)))
+    parser.add_argument('--name-prefix', default='sim',
+                        help='prefix for device ids and display names '
+                             '(default: %(default)s)')
+    parser.add_argument('--no-multiplexed-streams', action='store_true',
+                        help='behave like firmware without a multiplexed '
+                             'stream port')
+    parser.add_argument('--no-bulk-register-read', action='store_true',
+                        help='behave like firmware without readRegisters')
+    args = parser.parse_args()
+
+    try:
+        sim = Simulator(args.devices, args.rate, args.bind,
+                        args.announce_addrs or DEFAULT_ANNOUNCE_ADDRS,
+                        args.name_prefix,
+                        multiplexed_streams=not args.no_multiplexed_streams,
+                        bulk_register_read=not args.no_bulk_register_read)
+    except ValueError as e:
+        parser.error(str(e))
+    print('Simulating {} devices, {} packets/s per stream'.format(
+        args.devices, args.rate))
+    try:
+        sim.run()
+    except KeyboardInterrupt:
+        pass
@@ -33,6 +33,8 @@ import numpy as np
 import decimal, re
 import ctypes
 import sys, struct
+import threading
+from .pgcollections import OrderedDict
 
 from . import debug
 
@@ -1248,6 +1250,56 @@ def downsample(data, n, axis=0, xvals='subsample'):
         return MetaArray(d2, info=info)
 
 
+## Number of vertex buffers (distinct lengths and connect modes) kept around
+## for reuse by arrayToQPath, per thread, and their maximum total size in
+## bytes. Buffers larger than that are never cached; allocating them is cheap
+## compared to building a path of that many vertices anyway.
+PATH_BUFFER_CACHE_SIZE = 8
+PATH_BUFFER_CACHE_BYTES = 32 * 2**20
+
+_pathBuffers = threading.local()
+
+def _pathBuffer(n, connect):
+    """Return a structured array for streaming n vertices into a QPainterPath,
+    with header and footer already written.
+
+    Buffers are cached by length and connect mode, as curves that are updated
+    continuously usually keep the same number of points. For 'all' and
+    'pairs', the connection column is filled in as well; for the other modes
+    it has to be written by the caller.
+    """
+    key = (n, connect if isinstance(connect, basestring) and connect != 'finite' else None)
+    cache = getattr(_pathBuffers, 'cache', None)
+    if cache is None:
+        cache = _pathBuffers.cache = OrderedDict()
+    arr = cache.pop(key, None)
+    if arr is None:
+        # create empty array, pad with extra space on either end
+        arr = np.empty(n+2, dtype=[('x', '>f8'), ('y', '>f8'), ('c', '>i4')])
+        # write first two integers
+        byteview = arr.view(dtype=np.ubyte)
+        byteview[:12] = 0
+        byteview.data[12:20] = struct.pack('>ii', n, 0)
+        # write last 0
+        lastInd = 20*(n+1)
+        byteview.data[lastInd:lastInd+4] = struct.pack('>i', 0)
+
+        if key[1] == 'all':
+            arr[1:-1]['c'] = 1
+        elif key[1] == 'pairs':
+            c = arr[1:-1]['c']
+            c[0::2] = 1
+            c[1::2] = 0
+        if arr.nbytes > PATH_BUFFER_CACHE_BYTES:
+            return arr
+        cachedBytes = sum(a.nbytes for a in cache.values())
+        while cache and (len(cache) >= PATH_BUFFER_CACHE_SIZE or
+                         cachedBytes + arr.nbytes > PATH_BUFFER_CACHE_BYTES):
+            cachedBytes -= cache.popitem(last=False)[1].nbytes
+    cache[key] = arr
+    return arr
+
+
 def arrayToQPath(x, y, connect='all'):
     """Convert an array of x,y coordinats to QPainterPath as efficiently as possible.
     The *connect* argument may be 'all', indicating that each point should be
@@ -1292,42 +1344,33 @@ def arrayToQPath(x, y, connect='all'):
 
     #profiler = debug.Profiler()
     n = x.shape[0]
-    # create empty array, pad with extra space on either end
-    arr = np.empty(n+2, dtype=[('x', '>f8'), ('y', '>f8'), ('c', '>i4')])
-    # write first two integers
-    #profiler('allocate empty')
+    if isinstance(connect, basestring):
+        if connect not in ('all', 'pairs', 'finite'):
+            raise Exception('connect argument must be "all", "pairs", "finite", or array')
+        if connect == 'pairs' and n % 2 != 0:
+            raise Exception("x,y array lengths must be multiple of 2 to use connect='pairs'")
+    elif not isinstance(connect, np.ndarray):
+        raise Exception('connect argument must be "all", "pairs", "finite", or array')
+
+    # get a buffer with header, footer and (for 'all' and 'pairs') the
+    # connection column already filled in
+    arr = _pathBuffer(n, connect)
     byteview = arr.view(dtype=np.ubyte)
-    byteview[:12] = 0
-    byteview.data[12:20] = struct.pack('>ii', n, 0)
-    #profiler('pack header')
+    #profiler('allocate empty')
+
     # Fill array with vertex values
     arr[1:-1]['x'] = x
     arr[1:-1]['y'] = y
 
     # decide which points are connected by lines
-    if connect == 'pairs':
-        connect = np.empty((n/2,2), dtype=np.int32)
-        if connect.size != n:
-            raise Exception("x,y array lengths must be multiple of 2 to use connect='pairs'")
-        connect[:,0] = 1
-        connect[:,1] = 0
-        connect = connect.flatten()
-    if connect == 'finite':
-        connect = np.isfinite(x) & np.isfinite(y)
+    if isinstance(connect, np.ndarray):
         arr[1:-1]['c'] = connect
-    if connect == 'all':
-        arr[1:-1]['c'] = 1
-    elif isinstance(connect, np.ndarray):
-        arr[1:-1]['c'] = connect
-    else:
-        raise Exception('connect argument must be "all", "pairs", or array')
+    elif connect == 'finite':
+        arr[1:-1]['c'] = np.isfinite(x) & np.isfinite(y)
 
     #profiler('fill array')
-    # write last 0
-    lastInd = 20*(n+1)
-    byteview.data[lastInd:lastInd+4] = struct.pack('>i', 0)
-    #profiler('footer')
     # create datastream object and stream into path
+    lastInd = 20*(n+1)
 
     ## Avoiding this method because QByteArray(str) leaks memory in PySide
     #buf = QtCore.QByteArray(arr.data[12:lastInd+4])  # I think one unnecessary copy happens here
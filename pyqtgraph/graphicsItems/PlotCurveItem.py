@@ -12,6 +12,7 @@ from ..Point import Point
 import struct, sys
 from .. import getConfigOption
 from .. import debug
+from ..python2_3 import basestring
 
 __all__ = ['PlotCurveItem']
 class PlotCurveItem(GraphicsObject):
@@ -68,7 +69,10 @@ class PlotCurveItem(GraphicsObject):
             'antialias': getConfigOption('antialias'),
             'connect': 'all',
             'mouseWidth': 8, # width of shape responding to mouse click
+            'pixelDecimation': False,
         }
+        self._decimationColumns = None
+        self._uniformXCache = (None, None)
         self.setClickable(kargs.get('clickable', False))
         self.setData(*args, **kargs)
         
@@ -108,31 +112,41 @@ class PlotCurveItem(GraphicsObject):
         if x is None or len(x) == 0:
             return (None, None)
             
-        if ax == 0:
-            d = x
-            d2 = y
-        elif ax == 1:
-            d = y
-            d2 = x
+        uniform = self.xUniform is not None and not self.opts['stepMode']
+        if uniform and ax == 0 and frac >= 1.0 and orthoRange is None:
+            ## x is known to be x0 + i*dx; no need to look at the data.
+            x0, dx = self.xUniform
+            x1 = x0 + dx * (len(x) - 1)
+            b = (min(x0, x1), max(x0, x1))
+        else:
+            if ax == 0:
+                d = x
+                d2 = y
+            elif ax == 1:
+                d = y
+                d2 = x
 
-        ## If an orthogonal range is specified, mask the data now
-        if orthoRange is not None:
-            mask = (d2 >= orthoRange[0]) * (d2 <= orthoRange[1])
-            d = d[mask]
-            #d2 = d2[mask]
-            
-        if len(d) == 0:
-            return (None, None)
+            ## If an orthogonal range is specified, mask the data now
+            if orthoRange is not None:
+                if uniform and ax == 1:
+                    d = d[self._uniformSlice(orthoRange)]
+                else:
+                    mask = (d2 >= orthoRange[0]) * (d2 <= orthoRange[1])
+                    d = d[mask]
+                    #d2 = d2[mask]
+                
+            if len(d) == 0:
+                return (None, None)
 
-        ## Get min/max (or percentiles) of the requested data range
-        if frac >= 1.0:
-            b = (np.nanmin(d), np.nanmax(d))
-        elif frac <= 0.0:
-            raise Exception("Value for parameter 'frac' must be > 0. (got %s)" % str(frac))
-        else:
-            mask = np.isfinite(d)
-            d = d[mask]
-            b = np.percentile(d, [50 * (1 - frac), 50 * (1 + frac)])
+            ## Get min/max (or percentiles) of the requested data range
+            if frac >= 1.0:
+                b = (np.nanmin(d), np.nanmax(d))
+            elif frac <= 0.0:
+                raise Exception("Value for parameter 'frac' must be > 0. (got %s)" % str(frac))
+            else:
+                mask = np.isfinite(d)
+                d = d[mask]
+                b = np.percentile(d, [50 * (1 - frac), 50 * (1 + frac)])
 
         ## adjust for fill level
         if ax == 1 and self.opts['fillLevel'] is not None:
@@ -148,6 +162,17 @@ class PlotCurveItem(GraphicsObject):
             
         self._boundsCache[ax] = [(frac, orthoRange), b]
         return b
+
+    def _uniformSlice(self, xRange):
+        ## Index range of the uniformly sampled points with x inside xRange.
+        x0, dx = self.xUniform
+        i0 = (xRange[0] - x0) / dx
+        i1 = (xRange[1] - x0) / dx
+        if i0 > i1:
+            i0, i1 = i1, i0
+        start = max(0, int(np.ceil(i0)))
+        stop = min(len(self.yData), int(np.floor(i1)) + 1)
+        return slice(start, max(start, stop))
             
     def pixelPadding(self):
         pen = self.opts['pen']
@@ -194,6 +219,11 @@ class PlotCurveItem(GraphicsObject):
     def viewTransformChanged(self):
         self.invalidateBounds()
         self.prepareGeometryChange()
+        ## Panning does not change the decimation; only rebuild the path if the
+        ## data now spans a different number of pixels.
+        if self.path is not None and self._usePixelDecimation():
+            if self._pixelColumns() != self._decimationColumns:
+                self._invalidatePath()
         
     #def boundingRect(self):
         #if self._boundingRect is None:
@@ -262,11 +292,25 @@ class PlotCurveItem(GraphicsObject):
         self.invalidateBounds()
         self.update()
 
+    def setPixelDecimation(self, enable):
+        """Set whether the curve is reduced to the min/max of each pixel
+        column before drawing (see :func:`setData <pyqtgraph.PlotCurveItem.setData>`).
+        """
+        if self.opts['pixelDecimation'] == enable:
+            return
+        self.opts['pixelDecimation'] = enable
+        self._invalidatePath()
+
     def setData(self, *args, **kargs):
         """
         ==============  ========================================================
         **Arguments:**
         x, y            (numpy arrays) Data to show 
+        x0, dx          (float) For uniformly sampled data, may be given
+                        instead of x, which is then taken to be x0 + i*dx.
+                        The x array is only regenerated when the number of
+                        samples, x0 or dx change, and the x bounds are
+                        computed without looking at the data.
         pen             Pen to use when drawing. Any single argument accepted by
                         :func:`mkPen <pyqtgraph.mkPen>` is allowed.
         shadowPen       Pen for drawing behind the primary pen. Usually this
@@ -288,6 +332,13 @@ class PlotCurveItem(GraphicsObject):
                         to be drawn. "finite" causes segments to be omitted if
                         they are attached to nan or inf values. For any other
                         connectivity, specify an array of boolean values.
+        pixelDecimation (bool) If True, the data is reduced to the minimum and
+                        maximum of each horizontal pixel column before the
+                        path is built, which preserves peaks while drawing
+                        only about two vertices per pixel. Requires x to be
+                        sorted; only applies to connect="all" without
+                        stepMode. The result is cached until the data or the
+                        view width changes.
         ==============  ========================================================
         
         If non-keyword arguments are used, they will be interpreted as
@@ -309,7 +360,11 @@ class PlotCurveItem(GraphicsObject):
         
         if 'y' not in kargs or kargs['y'] is None:
             kargs['y'] = np.array([])
-        if 'x' not in kargs or kargs['x'] is None:
+        self.xUniform = None
+        if kargs.get('x') is None and 'dx' in kargs:
+            self.xUniform = (kargs.get('x0', 0), kargs['dx'])
+            kargs['x'] = self._uniformX(len(kargs['y']), *self.xUniform)
+        elif 'x' not in kargs or kargs['x'] is None:
             kargs['x'] = np.arange(len(kargs['y']))
             
         for k in ['x', 'y']:
@@ -363,6 +418,8 @@ class PlotCurveItem(GraphicsObject):
             self.setBrush(kargs['brush'])
         if 'antialias' in kargs:
             self.opts['antialias'] = kargs['antialias']
+        if 'pixelDecimation' in kargs:
+            self.opts['pixelDecimation'] = kargs['pixelDecimation']
         
         
         profiler('set')
@@ -370,6 +427,16 @@ class PlotCurveItem(GraphicsObject):
         profiler('update')
         self.sigPlotChanged.emit(self)
         profiler('emit')
+
+    def _uniformX(self, n, x0, dx):
+        ## Returns x0 + i*dx for i in range(n), reusing the previous array if
+        ## the parameters did not change (the common case for streaming data).
+        key, x = self._uniformXCache
+        if key != (n, x0, dx):
+            x = np.arange(n) * dx
+            x += x0
+            self._uniformXCache = ((n, x0, dx), x)
+        return x
         
     def generatePath(self, x, y):
         if self.opts['stepMode']:
@@ -401,12 +468,41 @@ class PlotCurveItem(GraphicsObject):
             if x is None or len(x) == 0 or y is None or len(y) == 0:
                 self.path = QtGui.QPainterPath()
             else:
-                self.path = self.generatePath(*self.getData())
+                if self._usePixelDecimation():
+                    self._decimationColumns = self._pixelColumns()
+                    if self._decimationColumns is not None:
+                        x, y = peakDecimate(x, y, self._decimationColumns)
+                self.path = self.generatePath(x, y)
             self.fillPath = None
             self._mouseShape = None
             
         return self.path
 
+    def _invalidatePath(self):
+        self.path = None
+        self.fillPath = None
+        self._mouseShape = None
+        self.update()
+
+    def _usePixelDecimation(self):
+        return (self.opts['pixelDecimation'] and not self.opts['stepMode'] and
+                isinstance(self.opts['connect'], basestring) and
+                self.opts['connect'] == 'all')
+
+    def _pixelColumns(self):
+        ## Number of horizontal pixels spanned by the data, or None if the
+        ## item has not been displayed yet.
+        x = self.xData
+        if x is None or len(x) < 2:
+            return None
+        px = self.pixelLength(Point(1, 0))
+        if not px:
+            return None
+        span = abs(float(x[-1]) - float(x[0]))
+        if not np.isfinite(span):
+            return None
+        return max(1, int(np.ceil(span / px)))
+
     @debug.warnOnException  ## raising an exception here causes crash
     def paint(self, p, opt, widget):
         profiler = debug.Profiler()
@@ -538,6 +634,7 @@ class PlotCurveItem(GraphicsObject):
         self.yData = None
         self.xDisp = None  ## display values (after log / fft)
         self.yDisp = None
+        self.xUniform = None  ## (x0, dx) if x was given implicitly
         self.path = None
         self.fillPath = None
         self._mouseShape = None
@@ -571,6 +668,34 @@ class PlotCurveItem(GraphicsObject):
             
 
 
+def peakDecimate(x, y, columns):
+    """Reduce (x, y) to the minimum and maximum of y in each of *columns*
+    equally sized blocks of samples, as a saw wave following the envelope of
+    the data. x must be sorted.
+
+    Returns the input unchanged if there are fewer than two samples per
+    column.
+    """
+    n = len(y)
+    ds = n // columns
+    if ds < 2:
+        return x, y
+
+    nb = n // ds
+    rem = n - nb * ds
+    blocks = y[:nb*ds].reshape(nb, ds)
+
+    y2 = np.empty((nb + (rem > 0), 2), dtype=np.result_type(y.dtype, np.float32))
+    np.minimum.reduce(blocks, axis=1, out=y2[:nb, 0])
+    np.maximum.reduce(blocks, axis=1, out=y2[:nb, 1])
+    x2 = np.empty((nb + (rem > 0), 2), dtype=np.result_type(x.dtype, np.float32))
+    x2[:nb] = x[:nb*ds:ds, np.newaxis]
+    if rem > 0:
+        y2[nb] = y[nb*ds:].min(), y[nb*ds:].max()
+        x2[nb] = x[nb*ds]
+    return x2.reshape(x2.size), y2.reshape(y2.size)
+
+
 class ROIPlotItem(PlotCurveItem):
     """Plot curve that monitors an ROI and image for changes to automatically replot."""
     def __init__(self, roi, data, img, axes=(0,1), xVals=None, color=None):
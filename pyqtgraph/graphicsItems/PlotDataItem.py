@@ -43,6 +43,8 @@ class PlotDataItem(GraphicsObject):
             PlotDataItem(xValues, yValues)      x and y values may be any sequence (including ndarray) of real numbers
             PlotDataItem(yValues)               y values only -- x will be automatically set to range(len(y))
             PlotDataItem(x=xValues, y=yValues)  x and y given by keyword arguments
+            PlotDataItem(y=yValues, x0=x0, dx=dx)  uniformly sampled data with x = x0 + i*dx. See
+                                                :func:`PlotCurveItem.setData <pyqtgraph.PlotCurveItem.setData>`.
             PlotDataItem(ndarray(Nx2))          numpy array with shape (N, 2) where x=data[:,0] and y=data[:,1]
             =================================== ======================================
         
@@ -115,6 +117,15 @@ class PlotDataItem(GraphicsObject):
                              the containing ViewBox. This can improve performance when plotting
                              very large data sets where only a fraction of the data is visible
                              at any time.
+            peakPyramid      (bool) If True, 'peak' downsampling reads from a pyramid of
+                             block minima/maxima at power-of-two factors, built once after
+                             setData() or appendData(), instead of reducing the visible
+                             data on every view change. The downsampling factor is rounded
+                             down to a power of two. Makes panning/zooming through very
+                             long recordings O(pixels) at the cost of ~2x the memory of y.
+            pixelDecimation  (bool) If True, the curve is reduced to the min/max of each pixel
+                             column before drawing. See :func:`PlotCurveItem.setData
+                             <pyqtgraph.PlotCurveItem.setData>`.
             identical        *deprecated*
             ================ =====================================================================
         
@@ -130,6 +141,8 @@ class PlotDataItem(GraphicsObject):
         self.yData = None
         self.xDisp = None
         self.yDisp = None
+        self.xUniform = None
+        self._peakPyramid = None
         #self.dataMask = None
         #self.curves = []
         #self.scatters = []
@@ -171,6 +184,8 @@ class PlotDataItem(GraphicsObject):
             'downsampleMethod': 'peak',
             'autoDownsampleFactor': 5.,  # draw ~5 samples per pixel
             'clipToView': False,
+            'peakPyramid': False,
+            'pixelDecimation': False,
             
             'data': None,
         }
@@ -201,6 +216,7 @@ class PlotDataItem(GraphicsObject):
             return
         self.opts['fftMode'] = mode
         self.xDisp = self.yDisp = None
+        self._peakPyramid = None
         self.xClean = self.yClean = None
         self.updateItems()
         self.informViewBoundsChanged()
@@ -210,6 +226,7 @@ class PlotDataItem(GraphicsObject):
             return
         self.opts['logMode'] = [xMode, yMode]
         self.xDisp = self.yDisp = None
+        self._peakPyramid = None
         self.xClean = self.yClean = None
         self.updateItems()
         self.informViewBoundsChanged()
@@ -297,7 +314,7 @@ class PlotDataItem(GraphicsObject):
         #self.scatter.setSymbolSize(symbolSize)
         self.updateItems()
 
-    def setDownsampling(self, ds=None, auto=None, method=None):
+    def setDownsampling(self, ds=None, auto=None, method=None, pyramid=None):
         """
         Set the downsampling mode of this item. Downsampling reduces the number
         of samples drawn to increase performance. 
@@ -313,6 +330,9 @@ class PlotDataItem(GraphicsObject):
                         'peak': Downsample by drawing a saw wave that follows the min
                         and max of the original data. This method produces the best
                         visual representation of the data but is slower.
+        pyramid         (bool) If True, 'peak' downsampling uses a precomputed min/max
+                        pyramid. See the *peakPyramid* argument of
+                        :func:`__init__() <pyqtgraph.PlotDataItem.__init__>`.
         ==============  =================================================================
         """
         changed = False
@@ -329,6 +349,11 @@ class PlotDataItem(GraphicsObject):
             if self.opts['downsampleMethod'] != method:
                 changed = True
                 self.opts['downsampleMethod'] = method
+
+        if pyramid is not None and self.opts['peakPyramid'] != pyramid:
+            self.opts['peakPyramid'] = pyramid
+            self._peakPyramid = None
+            changed = True
         
         if changed:
             self.xDisp = self.yDisp = None
@@ -443,19 +468,26 @@ class PlotDataItem(GraphicsObject):
 
         if y is None:
             return
-        if y is not None and x is None:
+        if isinstance(y, list):
+            y = np.array(y)
+
+        self.xUniform = None
+        if x is None and 'dx' in kargs:
+            self.xUniform = (kargs.get('x0', 0), kargs['dx'])
+            ## Share the cached x array with the curve.
+            x = self.curve._uniformX(len(y), *self.xUniform)
+        elif x is None:
             x = np.arange(len(y))
         
         if isinstance(x, list):
             x = np.array(x)
-        if isinstance(y, list):
-            y = np.array(y)
         
         self.xData = x.view(np.ndarray)  ## one last check to make sure there are no MetaArrays getting by
         self.yData = y.view(np.ndarray)
         self.xClean = self.yClean = None
         self.xDisp = None
         self.yDisp = None
+        self._peakPyramid = None
         profiler('set data')
         
         self.updateItems()
@@ -472,7 +504,7 @@ class PlotDataItem(GraphicsObject):
     def updateItems(self):
         
         curveArgs = {}
-        for k,v in [('pen','pen'), ('shadowPen','shadowPen'), ('fillLevel','fillLevel'), ('fillBrush', 'brush'), ('antialias', 'antialias'), ('connect', 'connect'), ('stepMode', 'stepMode')]:
+        for k,v in [('pen','pen'), ('shadowPen','shadowPen'), ('fillLevel','fillLevel'), ('fillBrush', 'brush'), ('antialias', 'antialias'), ('connect', 'connect'), ('stepMode', 'stepMode'), ('pixelDecimation', 'pixelDecimation')]:
             curveArgs[v] = self.opts[k]
         
         scatterArgs = {}
@@ -484,7 +516,12 @@ class PlotDataItem(GraphicsObject):
         #scatterArgs['mask'] = self.dataMask
         
         if curveArgs['pen'] is not None or (curveArgs['brush'] is not None and curveArgs['fillLevel'] is not None):
-            self.curve.setData(x=x, y=y, **curveArgs)
+            if self.xUniform is not None and x is self.xData:
+                ## x was not transformed, so the curve can keep its fast path.
+                x0, dx = self.xUniform
+                self.curve.setData(y=y, x0=x0, dx=dx, **curveArgs)
+            else:
+                self.curve.setData(x=x, y=y, **curveArgs)
             self.curve.show()
         else:
             self.curve.hide()
@@ -556,6 +593,8 @@ class PlotDataItem(GraphicsObject):
                         ds = int(max(1, int((x1-x0) / (width*self.opts['autoDownsampleFactor']))))
                     ## downsampling is expensive; delay until after clipping.
             
+            ## Index range of the visible samples.
+            x0, x1 = 0, len(x)
             if self.opts['clipToView']:
                 view = self.getViewBox()
                 if view is None or not view.autoRangeEnabled()[0]:
@@ -566,8 +605,32 @@ class PlotDataItem(GraphicsObject):
                         # clip to visible region extended by downsampling value
                         x0 = np.clip(int((range.left()-x[0])/dx)-1*ds , 0, len(x)-1)
                         x1 = np.clip(int((range.right()-x[0])/dx)+2*ds , 0, len(x)-1)
-                        x = x[x0:x1]
-                        y = y[x0:x1]
+
+            if ds > 1 and self.opts['downsampleMethod'] == 'peak' and self.opts['peakPyramid']:
+                ## Only the blocks covering the visible range are touched.
+                if self._peakPyramid is None:
+                    self._peakPyramid = peakPyramid(y)
+                levels = self._peakPyramid
+                if len(levels) > 0:
+                    level = min(int(np.log2(ds)), len(levels))
+                    f = 2**level
+                    lo, hi = levels[level-1]
+                    b0 = x0 // f
+                    b1 = min(len(lo), -(-x1 // f))
+                    n = max(0, b1 - b0)
+                    x2 = np.empty((n,2))
+                    x2[:] = x[b0*f:b1*f:f,np.newaxis]
+                    x = x2.reshape(n*2)
+                    y2 = np.empty((n,2))
+                    y2[:,0] = hi[b0:b1]
+                    y2[:,1] = lo[b0:b1]
+                    y = y2.reshape(n*2)
+                ds = 1
+            elif x0 > 0 or x1 < len(x):
+                ## Only slice if clipping narrowed the range, so untransformed
+                ## data is still recognised by updateItems().
+                x = x[x0:x1]
+                y = y[x0:x1]
                     
             if ds > 1:
                 if self.opts['downsampleMethod'] == 'subsample':
@@ -651,11 +714,38 @@ class PlotDataItem(GraphicsObject):
         #self.yClean = None
         self.xDisp = None
         self.yDisp = None
+        self.xUniform = None
         self.curve.setData([])
         self.scatter.setData([])
             
     def appendData(self, *args, **kargs):
-        pass
+        """
+        Append samples to the data displayed by this item. Accepts y or (x, y)
+        as positional or keyword arguments. If x is omitted, it continues the
+        uniform sampling given to setData() via x0/dx, or else extrapolates the
+        spacing of the last two x values.
+        """
+        if len(args) == 1:
+            kargs['y'] = args[0]
+        elif len(args) == 2:
+            kargs['x'], kargs['y'] = args
+        y = np.asarray(kargs['y'])
+        if self.yData is None:
+            self.setData(**kargs)
+            return
+
+        ## The data arrays are replaced by setData(), which also discards the
+        ## peak pyramid.
+        yData = np.concatenate((self.yData, y))
+        if kargs.get('x') is not None:
+            self.setData(x=np.concatenate((self.xData, kargs['x'])), y=yData)
+        elif self.xUniform is not None:
+            x0, dx = self.xUniform
+            self.setData(y=yData, x0=x0, dx=dx)
+        else:
+            dx = self.xData[-1] - self.xData[-2] if len(self.xData) > 1 else 1
+            x = self.xData[-1] + dx * np.arange(1, len(y) + 1)
+            self.setData(x=np.concatenate((self.xData, x)), y=yData)
     
     def curveClicked(self):
         self.sigClicked.emit(self)
@@ -685,6 +775,22 @@ class PlotDataItem(GraphicsObject):
         x = np.linspace(0, 0.5*len(x)/dt, len(y))
         return x, y
     
+def peakPyramid(y):
+    """Return a list of (min, max) array pairs of *y* reduced over blocks of
+    2, 4, 8, ... samples. Each level is computed from the previous one, so
+    building all of them is O(len(y)). Incomplete blocks at the end are
+    dropped.
+    """
+    levels = []
+    lo = hi = y
+    while len(lo) >= 2:
+        n = len(lo) // 2
+        lo = lo[:n*2].reshape(n, 2).min(axis=1)
+        hi = hi[:n*2].reshape(n, 2).max(axis=1)
+        levels.append((lo, hi))
+    return levels
+
+    
 def dataType(obj):
     if hasattr(obj, '__len__') and len(obj) == 0:
         return 'empty'
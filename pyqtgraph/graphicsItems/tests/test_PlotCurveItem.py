@@ -0,0 +1,73 @@
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph.graphicsItems.PlotCurveItem import peakDecimate
+pg.mkQApp()
+
+
+def test_peakDecimate():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 10.)
+    y[123] = 5
+    y[877] = -5
+
+    x2, y2 = peakDecimate(x, y, 100)
+    assert len(x2) == len(y2) == 200
+    assert y2.max() == 5
+    assert y2.min() == -5
+    # Each min/max pair is placed at the start of its block.
+    assert np.all(x2[::2] == x[::10])
+    assert np.all(x2[::2] == x2[1::2])
+
+    # Samples that do not fill a whole block end up in an extra one.
+    y[-1] = 7
+    x2, y2 = peakDecimate(x, y, 99)
+    assert len(x2) == 2 * 100
+    assert y2[-1] == 7
+
+    # Nothing to gain with fewer than two samples per column.
+    x2, y2 = peakDecimate(x, y, 600)
+    assert x2 is x and y2 is y
+
+
+def test_pixelDecimation():
+    plt = pg.PlotWidget()
+    plt.resize(400, 300)
+    plt.show()
+    pg.QtGui.QApplication.processEvents()
+
+    y = np.random.normal(size=100000)
+    curve = pg.PlotCurveItem(y, pixelDecimation=True)
+    plt.addItem(curve)
+    plt.setXRange(0, len(y), padding=0)
+    pg.QtGui.QApplication.processEvents()
+
+    width = plt.plotItem.vb.width()
+    assert curve.getPath().elementCount() <= 2 * (width + 2)
+
+    curve.setPixelDecimation(False)
+    assert curve.getPath().elementCount() == len(y)
+    plt.close()
+
+
+def test_uniformSampling():
+    y = np.random.normal(size=1000)
+    curve = pg.PlotCurveItem(y=y, x0=5, dx=0.5)
+    x = curve.getData()[0]
+    assert np.allclose(x, 5 + 0.5 * np.arange(1000))
+    assert curve.dataBounds(0) == (5, 5 + 0.5 * 999)
+    assert curve.dataBounds(1) == (y.min(), y.max())
+    assert curve.dataBounds(1, orthoRange=(10, 20)) == \
+        (y[10:31].min(), y[10:31].max())
+
+    # The x array is reused as long as the sampling does not change.
+    curve.setData(y=y * 2, x0=5, dx=0.5)
+    assert curve.getData()[0] is x
+    curve.setData(y=y, x0=0, dx=-1)
+    assert curve.dataBounds(0) == (-999, 0)
+    assert curve.dataBounds(1, orthoRange=(-2, 0)) == (y[:3].min(), y[:3].max())
+
+    item = pg.PlotDataItem(y=y, x0=0, dx=2)
+    assert item.getData()[0][-1] == 1998
+    assert item.curve.xUniform == (0, 2)
+    item.setData(y=y)
+    assert item.curve.xUniform is None
@@ -0,0 +1,51 @@
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph.graphicsItems.PlotDataItem import peakPyramid
+pg.mkQApp()
+
+
+def test_peakPyramid():
+    y = np.random.normal(size=1000)
+    levels = peakPyramid(y)
+    assert len(levels) == 9
+    for k, (lo, hi) in enumerate(levels):
+        f = 2**(k+1)
+        n = len(y) // f
+        assert np.all(lo == y[:n*f].reshape(n, f).min(axis=1))
+        assert np.all(hi == y[:n*f].reshape(n, f).max(axis=1))
+
+
+def test_peakPyramidDownsampling():
+    y = np.random.normal(size=4096)
+    x = np.arange(len(y)) * 0.5
+    item = pg.PlotDataItem(x, y)
+    item.setDownsampling(ds=8, method='peak')
+    xRef, yRef = item.getData()
+
+    item.setDownsampling(pyramid=True)
+    xp, yp = item.getData()
+    assert np.all(xp == xRef)
+    assert np.all(yp == yRef)
+
+    # Appended samples continue the x axis and show up in the downsampled
+    # data.
+    item.appendData(y=np.full(8, 10.))
+    xp, yp = item.getData()
+    assert np.all(np.diff(xp) >= 0)
+    assert xp[-1] == 2048 and yp.max() == 10
+
+    ref = pg.PlotDataItem(np.arange(len(y) + 8) * 0.5,
+                          np.concatenate((y, np.full(8, 10.))))
+    ref.setDownsampling(ds=8, method='peak')
+    xRef, yRef = ref.getData()
+    assert np.all(xp == xRef)
+    assert np.all(yp == yRef)
+
+
+def test_uniformSamplingDefaultOptions():
+    # Without clipping or downsampling, the data is passed on untransformed
+    # and the curve keeps its uniform sampling.
+    y = np.random.normal(size=1000)
+    item = pg.PlotDataItem(y=y, x0=1, dx=0.5)
+    assert item.getData()[0] is item.xData
+    assert item.curve.xUniform == (1, 0.5)
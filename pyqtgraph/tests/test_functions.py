@@ -110,7 +110,55 @@ def test_subArray():
     bb = pg.subArray(aa, offset=2, shape=(2,2,3), stride=(10,4,1))
     assert np.all(bb == cc)
     
-    
+
+
+def test_arrayToQPath():
+    def elements(path):
+        els = [path.elementAt(i) for i in range(path.elementCount())]
+        return [(e.x, e.y, e.isLineTo()) for e in els]
+
+    x = np.arange(6, dtype=float)
+    y = x ** 2
+
+    expected = [(x[i], y[i], i > 0) for i in range(6)]
+    assert elements(pg.arrayToQPath(x, y, connect='all')) == expected
+
+    expected = [(x[i], y[i], i % 2 == 1) for i in range(6)]
+    assert elements(pg.arrayToQPath(x, y, connect='pairs')) == expected
+    with pytest.raises(Exception):
+        pg.arrayToQPath(x[:5], y[:5], connect='pairs')
+
+    connect = np.array([1, 0, 1, 1, 0, 0], dtype=np.int32)
+    expected = [(x[i], y[i], i > 0 and connect[i-1] == 1) for i in range(6)]
+    assert elements(pg.arrayToQPath(x, y, connect=connect)) == expected
+
+    # Buffers are reused between calls with the same length; earlier paths
+    # must not change.
+    p1 = pg.arrayToQPath(x, y)
+    p2 = pg.arrayToQPath(x, -y)
+    assert elements(p1) == [(x[i], y[i], i > 0) for i in range(6)]
+    assert elements(p2) == [(x[i], -y[i], i > 0) for i in range(6)]
+
+    # Connection info from an array must not leak into later 'all' paths.
+    pg.arrayToQPath(x, y, connect=np.zeros(6, dtype=np.int32))
+    assert all(e[2] for e in elements(pg.arrayToQPath(x, y))[1:])
+
+
+def test_pathBufferCacheLimit():
+    from pyqtgraph.functions import _pathBuffer, PATH_BUFFER_CACHE_BYTES
+    # Small buffers are reused...
+    assert _pathBuffer(100, 'all') is _pathBuffer(100, 'all')
+    # ...but ones above the size limit are not kept alive.
+    n = PATH_BUFFER_CACHE_BYTES // 20
+    assert _pathBuffer(n, 'all') is not _pathBuffer(n, 'all')
+
+    # Filling the cache with buffers of different lengths never keeps more
+    # than the limit alive.
+    m = n // 3
+    bufs = [_pathBuffer(m + i, 'all') for i in range(4)]
+    assert _pathBuffer(m + 3, 'all') is bufs[3]
+    assert _pathBuffer(m, 'all') is not bufs[0]
+
     
 if __name__ == '__main__':
     test_interpolateArray()
\ No newline at end of file
@@ -1,25 +1,47 @@
+import collections
+import itertools
+import queue
+import threading
 import zmq
 
 from PyQt4 import QtCore as QtC
 
+# Maximum number of decoded messages buffered for the GUI thread by a
+# ReceiverThread before the oldest ones are dropped.
+DEFAULT_MAX_QUEUED_MSGS = 256
+
 
 class Socket(QtC.QObject):
     received_msg = QtC.pyqtSignal(bytes)
+
+    # Emitted instead of received_msg for messages with more than one frame
+    # (e.g. topic envelopes on SUB sockets).
+    received_multipart_msg = QtC.pyqtSignal(list)
+
     error = QtC.pyqtSignal(zmq.ZMQError)
 
-    def __init__(self, ctx, sock_type):
+    def __init__(self, ctx, sock_type, topics=(b'',)):
+        """
+        For SUB sockets, topics are the prefixes subscribed to initially; by
+        default, everything is received.
+        """
         QtC.QObject.__init__(self)
 
         self._socket = ctx.socket(sock_type)
 
+        # DEALER sockets do not add/strip the empty delimiter frame REQ/REP
+        # peers expect, so we do it ourselves to be able to talk to plain REP
+        # servers.
+        self._use_envelope = sock_type == zmq.DEALER
+
         # Do not try to reconnect. In our application, we expect services to
         # suddenly disappear if the physical device is unplugged. Reconnection
         # is handled via rediscovery on the application layer.
         self._socket.setsockopt(zmq.RECONNECT_IVL, -1)
 
         if sock_type == zmq.SUB:
-            # By default, subscribe to everything.
-            self._socket.setsockopt(zmq.SUBSCRIBE, b'')
+            for topic in topics:
+                self._socket.setsockopt(zmq.SUBSCRIBE, topic)
 
         fd = self._socket.getsockopt(zmq.FD)
         self._notifier = QtC.QSocketNotifier(fd, QtC.QSocketNotifier.Read, self)
@@ -28,13 +50,28 @@ class Socket(QtC.QObject):
         self._response_handler = None
         self._closed = False
 
+        # Messages are never dropped by the socket itself, so this stays zero;
+        # provided for interface compatibility with Subscription. Users that
+        # discard messages after receiving them keep their own count.
+        self.dropped_msgs = 0
+
     def connect(self, addrspec):
         self._socket.connect(addrspec)
 
     def send(self, msg):
         assert not self._closed
+        if self._use_envelope:
+            return self._socket.send_multipart([b'', msg])
         return self._socket.send(msg)
 
+    def subscribe_topic(self, topic):
+        assert not self._closed
+        self._socket.setsockopt(zmq.SUBSCRIBE, topic)
+
+    def unsubscribe_topic(self, topic):
+        assert not self._closed
+        self._socket.setsockopt(zmq.UNSUBSCRIBE, topic)
+
     def request(self, msg, response_handler):
         assert not self._closed
 
@@ -55,7 +92,14 @@ class Socket(QtC.QObject):
             # correctly. Do not continue to try to read if the socket has been
             # closed in the response handler to not signal spurious errors.
             while not self._closed:
-                msg = self._socket.recv(flags=zmq.NOBLOCK)
+                frames = self._socket.recv_multipart(flags=zmq.NOBLOCK)
+                if self._use_envelope:
+                    msg = frames[-1]
+                elif len(frames) > 1:
+                    self.received_multipart_msg.emit(frames)
+                    continue
+                else:
+                    msg = frames[0]
                 if self._response_handler:
                     handler = self._response_handler
                     self._response_handler = None
@@ -69,3 +113,209 @@ class Socket(QtC.QObject):
             if e.errno not in (zmq.EAGAIN, zmq.EFSM):
                 self._response_handler = None
                 self.error.emit(e)
+
+
+class Subscription:
+    """
+    Handle for a SUB socket managed by a ReceiverThread.
+
+    Mirrors the close() interface of Socket so callers can treat both the
+    same.
+    """
+
+    def __init__(self, receiver, token):
+        self._receiver = receiver
+        self._token = token
+        self._closed = False
+
+    @property
+    def dropped_msgs(self):
+        """
+        Number of messages received on this socket that were dropped because
+        the GUI thread fell behind.
+        """
+        return self._receiver._dropped_msgs_by_token.get(self._token, 0)
+
+    def subscribe_topic(self, topic):
+        assert not self._closed
+        self._receiver._send_command(
+            ('sockopt', self._token, zmq.SUBSCRIBE, topic))
+
+    def unsubscribe_topic(self, topic):
+        assert not self._closed
+        self._receiver._send_command(
+            ('sockopt', self._token, zmq.UNSUBSCRIBE, topic))
+
+    def close(self):
+        assert not self._closed
+        self._closed = True
+        self._receiver._unsubscribe(self._token)
+
+
+class ReceiverThread(QtC.QObject):
+    """
+    Receives and decodes messages from SUB sockets on a background thread.
+
+    The sockets are owned by the worker thread, which also runs the
+    user-supplied decode function on each message. The results are handed to
+    the GUI thread through a bounded queue and passed to the respective
+    handlers there. If the GUI thread falls behind, the oldest results are
+    dropped (see dropped_msgs).
+    """
+
+    _msgs_available = QtC.pyqtSignal()
+
+    def __init__(self, ctx, max_queued_msgs=DEFAULT_MAX_QUEUED_MSGS):
+        QtC.QObject.__init__(self)
+
+        self.dropped_msgs = 0
+        self._dropped_msgs_by_token = {}
+
+        self._ctx = ctx
+        self._next_token = itertools.count()
+        self._handlers = {}
+
+        self._results = collections.deque(maxlen=max_queued_msgs)
+        self._results_lock = threading.Lock()
+        self._msgs_available.connect(self._dispatch_results)
+
+        # Commands are passed through a thread-safe queue; the PAIR socket is
+        # only used to wake up the worker thread when there is a new one.
+        self._commands = queue.Queue()
+        wakeup_addr = 'inproc://qtzmq-receiver-{}'.format(id(self))
+        self._wakeup_recv = ctx.socket(zmq.PAIR)
+        self._wakeup_recv.bind(wakeup_addr)
+        self._wakeup_send = ctx.socket(zmq.PAIR)
+        self._wakeup_send.connect(wakeup_addr)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._closed = False
+
+    def subscribe(self, addrspec, decode_fn, handler, error_handler,
+                  topics=(b'',), multipart=False):
+        """
+        Connects a new SUB socket to the given address, initially subscribed to
+        the given topic prefixes.
+
+        decode_fn is called on the worker thread for every message (the list
+        of frames if multipart is set, the single frame otherwise); handler
+        (with the result) or error_handler (with the exception raised by
+        decode_fn or the socket) are later called on the GUI thread.
+        """
+        assert not self._closed
+
+        token = next(self._next_token)
+        self._handlers[token] = (handler, error_handler)
+        self._send_command(('subscribe', token, addrspec, decode_fn,
+                            tuple(topics), multipart))
+        return Subscription(self, token)
+
+    def close(self):
+        assert not self._closed
+        self._closed = True
+
+        self._send_command(('stop',))
+        self._thread.join()
+        self._wakeup_send.close()
+        self._handlers.clear()
+
+    def _unsubscribe(self, token):
+        # Results still in flight for this subscription are discarded by
+        # _dispatch_results.
+        self._handlers.pop(token, None)
+        self._dropped_msgs_by_token.pop(token, None)
+        if not self._closed:
+            self._send_command(('unsubscribe', token))
+
+    def _send_command(self, cmd):
+        self._commands.put(cmd)
+        self._wakeup_send.send(b'')
+
+    def _dispatch_results(self):
+        with self._results_lock:
+            results = list(self._results)
+            self._results.clear()
+
+        for token, result, error in results:
+            handlers = self._handlers.get(token)
+            if not handlers:
+                continue
+            handler, error_handler = handlers
+            if error is None:
+                handler(result)
+            else:
+                error_handler(error)
+
+    def _push_result(self, token, result, error):
+        with self._results_lock:
+            notify = not self._results
+            if len(self._results) == self._results.maxlen:
+                self.dropped_msgs += 1
+                dropped_token = self._results[0][0]
+                # Do not resurrect the entry for a closed subscription.
+                if dropped_token in self._handlers:
+                    self._dropped_msgs_by_token[dropped_token] = \
+                        self._dropped_msgs_by_token.get(dropped_token, 0) + 1
+            self._results.append((token, result, error))
+
+        # Only notify on the first new result to avoid flooding the GUI event
+        # loop; all pending results are drained at once.
+        if notify:
+            self._msgs_available.emit()
+
+    def _run(self):
+        poller = zmq.Poller()
+        poller.register(self._wakeup_recv, zmq.POLLIN)
+        sockets = {}
+        token_to_socket = {}
+
+        while True:
+            for sock, _ in poller.poll():
+                if sock is self._wakeup_recv:
+                    sock.recv()
+                    cmd = self._commands.get()
+                    if cmd[0] == 'stop':
+                        for s in sockets:
+                            s.close()
+                        self._wakeup_recv.close()
+                        return
+
+                    if cmd[0] == 'subscribe':
+                        _, token, addrspec, decode_fn, topics, multipart = cmd
+                        s = self._ctx.socket(zmq.SUB)
+                        # See Socket for the rationale for this.
+                        s.setsockopt(zmq.RECONNECT_IVL, -1)
+                        for topic in topics:
+                            s.setsockopt(zmq.SUBSCRIBE, topic)
+                        s.connect(addrspec)
+                        poller.register(s, zmq.POLLIN)
+                        sockets[s] = (token, decode_fn, multipart)
+                        token_to_socket[token] = s
+                    elif cmd[0] == 'sockopt':
+                        _, token, opt, value = cmd
+                        token_to_socket[token].setsockopt(opt, value)
+                    elif cmd[0] == 'unsubscribe':
+                        s = token_to_socket.pop(cmd[1])
+                        poller.unregister(s)
+                        del sockets[s]
+                        s.close()
+                    continue
+
+                if sock not in sockets:
+                    # Closed while handling an earlier event of this round.
+                    continue
+                token, decode_fn, multipart = sockets[sock]
+                try:
+                    while True:
+                        if multipart:
+                            msg = sock.recv_multipart(flags=zmq.NOBLOCK)
+                        else:
+                            msg = sock.recv(flags=zmq.NOBLOCK)
+                        try:
+                            self._push_result(token, decode_fn(msg), None)
+                        except Exception as e:
+                            self._push_result(token, None, e)
+                except zmq.ZMQError as e:
+                    if e.errno != zmq.EAGAIN:
+                        self._push_result(token, None, e)
@@ -0,0 +1,80 @@
+import io
+import numpy as np
+import os
+from devil.evlfile import EvlFile, INDEX_FILE_SUFFIX
+
+
+def _append(path, *arrays):
+    with open(path, 'ab') as f:
+        for a in arrays:
+            np.save(f, a)
+
+
+def test_records(tmp_path):
+    path = str(tmp_path / 'snapshots.evl')
+    data = [np.arange(10, dtype=np.float64) * i for i in range(5)]
+    _append(path, *data)
+
+    evl = EvlFile(path)
+    assert len(evl) == 5
+    for i, d in enumerate(data):
+        assert np.array_equal(evl[i], d)
+
+    # Records of equal shape come back as one strided view of the file.
+    stacked = evl[1:4]
+    assert isinstance(stacked, np.ndarray)
+    assert stacked.shape == (3, 10)
+    assert np.array_equal(stacked, np.array(data[1:4]))
+    assert not stacked.flags.writeable
+
+    for sl in (slice(None, None, 2), slice(3, 0, -1), slice(None, None, -2)):
+        assert np.array_equal(evl[sl], np.array(data[sl]))
+
+    # Mixed shapes fall back to a list of views.
+    _append(path, np.zeros((2, 3), np.int8))
+    evl.refresh()
+    mixed = evl[3:]
+    assert isinstance(mixed, list)
+    assert np.array_equal(mixed[2], np.zeros((2, 3)))
+    mixed = evl[1::4]
+    assert len(mixed) == 2
+    assert np.array_equal(mixed[1], np.zeros((2, 3)))
+
+
+def test_incremental_scan(tmp_path):
+    path = str(tmp_path / 'snapshots.evl')
+    _append(path, np.arange(4))
+    evl = EvlFile(path)
+
+    # A record that is only partly written is not picked up yet.
+    buf = io.BytesIO()
+    np.save(buf, np.arange(1000))
+    record = buf.getvalue()
+    with open(path, 'ab') as f:
+        f.write(record[:-8])
+    evl.refresh()
+    assert len(evl) == 1
+
+    with open(path, 'ab') as f:
+        f.write(record[-8:])
+    evl.refresh()
+    assert len(evl) == 2
+    assert np.array_equal(evl[1], np.arange(1000))
+
+
+def test_index_file(tmp_path):
+    path = str(tmp_path / 'snapshots.evl')
+    _append(path, np.arange(3), np.ones((2, 2)))
+    EvlFile(path)
+    assert os.path.exists(path + INDEX_FILE_SUFFIX)
+
+    # Records are taken from the index, with only the new ones scanned.
+    _append(path, np.arange(5))
+    evl = EvlFile(path)
+    assert evl.shapes() == [(3,), (2, 2), (5,)]
+    assert np.array_equal(evl[2], np.arange(5))
+
+    # A corrupt index is ignored.
+    with open(path + INDEX_FILE_SUFFIX, 'w') as f:
+        f.write('{')
+    assert EvlFile(path).shapes() == [(3,), (2, 2), (5,)]
@@ -0,0 +1,207 @@
+import http.server
+import influxdb
+import json
+import numpy as np
+import threading
+import time
+from devil_influxdb_pusher import PointWriter, SampleHistogram, \
+    SpillJournal, WindowAccumulator
+
+
+def test_window_accumulator():
+    windows = []
+    acc = WindowAccumulator(100, lambda h: windows.append(
+        (h.count, h.min(), h.max(), h.mean())))
+
+    samples = np.arange(-125, 125)
+    # Chunks not aligned with the window size must be split across windows.
+    for chunk in np.array_split(samples, 7):
+        acc.append(chunk)
+
+    assert windows == [(100, -125, -26, -75.5), (100, -25, 74, 24.5)]
+
+    # The remaining 50 samples complete the next window.
+    acc.append(np.full(50, 3))
+    assert len(windows) == 3
+    assert windows[2][:3] == (100, 3, 124)
+
+
+class FakeInfluxDB:
+    """
+    Minimal HTTP endpoint accepting InfluxDB writes on localhost.
+
+    Responds to each write with the next status code from statuses (204 once
+    they have run out) and records the points of the successful ones.
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        self.written = []
+
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                lines = body.decode().splitlines()
+                status = fake.statuses.pop(0) if fake.statuses else 204
+                fake.requests.append((status, len(lines)))
+                if status == 204:
+                    fake.written.extend(lines)
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def client(self):
+        return influxdb.InfluxDBClient('127.0.0.1',
+                                       self._server.server_address[1],
+                                       database='test', retries=1)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _points(start, count):
+    return [{'measurement': 'test', 'time': i, 'fields': {'value': i}}
+            for i in range(start, start + count)]
+
+
+def _wait_until(predicate, timeout_secs=10):
+    deadline = time.monotonic() + timeout_secs
+    while not predicate():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.01)
+
+
+def test_point_writer_batches():
+    db = FakeInfluxDB()
+    writer = PointWriter(db.client(), batch_size=10, flush_interval_secs=60)
+    for p in _points(0, 25):
+        writer.write(p)
+
+    # Full batches are written right away, the rest is held back...
+    _wait_until(lambda: len(db.requests) == 2)
+    assert db.requests == [(204, 10), (204, 10)]
+    assert writer.queued_points() == 5
+
+    # ...until the writer is closed.
+    writer.close()
+    assert db.requests[2] == (204, 5)
+    assert writer.written_points == 25
+    assert writer.dropped_points == 0
+    db.close()
+
+
+def test_point_writer_drops_oldest_when_full():
+    db = FakeInfluxDB()
+    writer = PointWriter(db.client(), batch_size=100, flush_interval_secs=60,
+                         max_queued_points=5)
+    for p in _points(0, 8):
+        writer.write(p)
+    assert writer.dropped_points == 3
+    assert writer.queued_points() == 5
+
+    writer.close()
+    assert writer.written_points == 5
+    # The newest points are kept.
+    assert [l.split()[-1] for l in db.written] == [str(i) for i in range(3, 8)]
+    db.close()
+
+
+def test_point_writer_retries_after_server_error(tmp_path):
+    db = FakeInfluxDB(statuses=[500])
+    writer = PointWriter(db.client(), batch_size=10, flush_interval_secs=60,
+                         journal=SpillJournal(str(tmp_path)),
+                         replay_interval_secs=0)
+    for p in _points(0, 10):
+        writer.write(p)
+    _wait_until(lambda: writer.spilled_points == 10)
+    assert writer.failed_writes == 1
+    assert writer.dropped_points == 0
+
+    # Once a write succeeds again, the spilled points are replayed.
+    for p in _points(10, 10):
+        writer.write(p)
+    _wait_until(lambda: writer.replayed_points == 10)
+    writer.close()
+
+    assert writer.written_points == 10
+    assert sorted(int(l.split()[-1]) for l in db.written) == list(range(20))
+    db.close()
+
+
+def test_sample_histogram_matches_numpy():
+    rng = np.random.RandomState(0)
+    for size in (1, 2, 7, 1000):
+        samples = rng.randint(-512, 512, size=size)
+        hist = SampleHistogram()
+        hist.add(samples)
+
+        assert hist.min() == samples.min()
+        assert hist.max() == samples.max()
+        assert np.isclose(hist.mean(), samples.mean())
+        assert np.isclose(hist.rms(), np.sqrt(np.mean(samples ** 2.)))
+
+        qs = [0, 1, 20, 50, 80, 99.5, 100]
+        assert np.allclose(hist.percentiles(qs), np.percentile(samples, qs))
+
+    # Heavily repeated values exercise the interpolation between bins.
+    samples = np.repeat([-3, 0, 5], [10, 1, 10])
+    hist = SampleHistogram()
+    hist.add(samples)
+    assert np.allclose(hist.percentiles([25, 50, 75]),
+                       np.percentile(samples, [25, 50, 75]))
+
+
+def test_spill_journal_replay(tmp_path):
+    journal = SpillJournal(str(tmp_path), segment_bytes=200)
+    assert journal.is_empty()
+    journal.append(_points(0, 10))
+    journal.append(_points(10, 10))
+
+    replayed = []
+    while not journal.is_empty():
+        batch = journal.read_batch(3)
+        # Points are only removed once consumed.
+        assert journal.read_batch(3) == batch
+        journal.consume()
+        replayed.extend(batch)
+    assert replayed == _points(0, 20)
+    assert not list(tmp_path.iterdir())
+
+
+def test_spill_journal_survives_restart(tmp_path):
+    journal = SpillJournal(str(tmp_path))
+    journal.append(_points(0, 5))
+    journal.close()
+
+    journal = SpillJournal(str(tmp_path))
+    assert journal.read_batch(100) == _points(0, 5)
+
+
+def test_spill_journal_cap(tmp_path):
+    # All points have the same size as their numbers have the same length.
+    point_bytes = len(json.dumps(_points(100, 1)[0],
+                                 separators=(',', ':'))) + 1
+    journal = SpillJournal(str(tmp_path), segment_bytes=10 * point_bytes,
+                           max_bytes=15 * point_bytes)
+    journal.append(_points(100, 10))
+
+    # Replay part of the oldest segment before it is discarded.
+    journal.read_batch(4)
+    journal.consume()
+
+    journal.append(_points(110, 10))
+    # Only the six points not replayed yet count as dropped.
+    assert journal.dropped_points == 6
+    assert journal.read_batch(100) == _points(110, 10)
@@ -0,0 +1,97 @@
+import numpy as np
+import os
+from devil.channel import StreamPacket, MSGPACK_EXT_INT8ARRAY
+from devil.streamarchive import ArchiveWriter, chunk_paths, compress_chunk, \
+    load_chunk, COMPRESSED_CHUNK_SUFFIX
+
+
+def _packet(i, stream_idx=0):
+    raw = (np.arange(16) + i).astype(np.int8)
+    return StreamPacket(stream_idx, 1e-6, i, MSGPACK_EXT_INT8ARRAY,
+                        raw.tobytes(), timestamp=float(i))
+
+
+def _write(writer, start, count):
+    for i in range(start, start + count):
+        writer.write(_packet(i, i % 2))
+
+
+def _check_chunk(path, start, count):
+    index, samples = load_chunk(path)
+    assert len(index) == count
+    assert np.array_equal(index['timestamp'], np.arange(start, start + count))
+    assert np.array_equal(index['stream_idx'],
+                          np.arange(start, start + count) % 2)
+    for row, i in zip(index, range(start, start + count)):
+        offset = row['sample_offset']
+        raw = samples[offset:offset + row['sample_count']]
+        assert np.array_equal(raw, _packet(i).raw_samples)
+
+
+def test_rotation(tmp_path):
+    directory = str(tmp_path / 'archive')
+    # Each packet holds 16 bytes of samples; rotate after every 3 packets.
+    writer = ArchiveWriter(directory, chunk_bytes=48)
+    _write(writer, 0, 8)
+    writer.close()
+
+    paths = chunk_paths(directory)
+    assert len(paths) == 3
+    for k, (path, count) in enumerate(zip(paths, (3, 3, 2))):
+        _check_chunk(path, 3 * k, count)
+
+    # Numbering continues after the existing chunks.
+    writer = ArchiveWriter(directory, chunk_bytes=48)
+    _write(writer, 8, 1)
+    writer.close()
+    paths = chunk_paths(directory)
+    assert len(paths) == 4
+    assert paths[-1].endswith('chunk-000003')
+
+
+def test_compression(tmp_path):
+    directory = str(tmp_path / 'archive')
+    writer = ArchiveWriter(directory, chunk_bytes=48, compress=True)
+    _write(writer, 0, 5)
+    writer.close()
+
+    paths = chunk_paths(directory)
+    assert len(paths) == 2
+    assert all(p.endswith(COMPRESSED_CHUNK_SUFFIX) for p in paths)
+    assert sorted(os.listdir(directory)) == \
+        [os.path.basename(p) for p in paths]
+    _check_chunk(paths[0], 0, 3)
+    _check_chunk(paths[1], 3, 2)
+
+
+def test_chunk_listed_once_during_compression(tmp_path):
+    directory = str(tmp_path / 'archive')
+    writer = ArchiveWriter(directory)
+    _write(writer, 0, 2)
+    writer.close()
+
+    # Simulate the moment between the rename of the .npz file and the
+    # removal of the chunk directory.
+    path = chunk_paths(directory)[0]
+    index, samples = load_chunk(path)
+    np.savez_compressed(path + COMPRESSED_CHUNK_SUFFIX, index=index,
+                        samples=samples)
+    assert chunk_paths(directory) == [path + COMPRESSED_CHUNK_SUFFIX]
+
+    os.remove(path + COMPRESSED_CHUNK_SUFFIX)
+    compress_chunk(path)
+    assert chunk_paths(directory) == [path + COMPRESSED_CHUNK_SUFFIX]
+    _check_chunk(chunk_paths(directory)[0], 0, 2)
+
+
+def test_old_chunk_removal(tmp_path):
+    directory = str(tmp_path / 'archive')
+    writer = ArchiveWriter(directory, chunk_bytes=16, max_chunks=2)
+    _write(writer, 0, 5)
+    writer.close()
+
+    paths = chunk_paths(directory)
+    assert [os.path.basename(p) for p in paths] == \
+        ['chunk-000003', 'chunk-000004']
+    _check_chunk(paths[0], 3, 1)
+    _check_chunk(paths[1], 4, 1)